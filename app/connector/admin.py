@@ -1,3 +1,19 @@
 from django.contrib import admin
+from django.utils.html import format_html
 
-# Register your models here.
+from .models import QueryProfile
+
+
+class QueryProfileAdmin(admin.ModelAdmin):
+    list_display = ('group_name', 'duration_ms', 'snapshot_version', 'create_datetime')
+    list_filter = ('group_name',)
+    list_per_page = 100
+    readonly_fields = ('group_name', 'snapshot_version', 'duration_ms', 'sql', 'params', 'plan_format', 'create_datetime')
+    exclude = ('plan',)
+
+    def plan_format(self, instance):
+        return format_html('<pre><code>{content}</code></pre>', content=instance.plan)
+    plan_format.short_description = 'Plan'
+
+
+admin.site.register(QueryProfile, QueryProfileAdmin)
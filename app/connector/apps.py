@@ -5,3 +5,8 @@ import os
 class ConnectorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'connector'
+
+    def ready(self):
+        from .auth import connect_signals
+
+        connect_signals()
@@ -0,0 +1,202 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+from asgiref.sync import sync_to_async
+from ninja_jwt.authentication import AsyncJWTAuth, JWTAuth
+from ninja_jwt.exceptions import InvalidToken
+from ninja_jwt.settings import api_settings
+
+from .config import CONNECTOR_AUTH_CACHE_TTL, CONNECTOR_AUTH_CACHE_SIZE, CONNECTOR_AUTH_REDIS_URL
+
+
+logger = logging.getLogger(__name__)
+
+
+class UserCache:
+    """
+    Пользователи JWT в памяти процесса: id -> пользователь на ttl секунд, не больше maxsize записей.
+    При изменении пользователя, его групп или прав запись сбрасывается сигналами (см. connect_signals),
+    в остальных воркерах - через Redis pub/sub. Без Redis чужие воркеры увидят изменение через ttl
+    """
+
+    channel = 'connector:auth:invalidate'
+    # пауза перед переподключением подписки после ошибки Redis
+    redis_backoff = 30
+
+    def __init__(self, ttl: float, maxsize: int, redis_url: str = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.redis_url = redis_url
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        self._ensure_listener()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and time.monotonic() < entry[0]:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._users[user_id] = (time.monotonic() + self.ttl, user)
+            while len(self._users) > self.maxsize:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id=None, broadcast: bool = True):
+        """
+        Сбрасывает пользователя или, если user_id не указан, весь кэш (изменились права группы)
+        """
+        with self._lock:
+            self.invalidations += 1
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+        if broadcast and self.redis_url:
+            try:
+                redis.Redis.from_url(self.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5).publish(
+                    self.channel, '' if user_id is None else str(user_id)
+                )
+            except redis.RedisError as e:
+                logger.warning(f"Auth cache invalidation not broadcast: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._users),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+    def _ensure_listener(self):
+        # после fork (воркеры gunicorn) поток подписки родителя в процессе не существует
+        if not self.redis_url or self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen, name='auth-cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis.Redis.from_url(self.redis_url, socket_connect_timeout=0.5).pubsub()
+                pubsub.subscribe(self.channel)
+                # пока подписки не было, сообщения могли потеряться
+                self.invalidate(broadcast=False)
+                for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    user_id = message['data'].decode()
+                    self.invalidate(self._user_id(user_id) if user_id else None, broadcast=False)
+            except redis.RedisError as e:
+                logger.warning(f"Auth cache invalidation listener: {e}")
+                time.sleep(self.redis_backoff)
+
+    @staticmethod
+    def _user_id(raw: str):
+        # ключи кэша - значения claim user_id из токена, для стандартного pk это int
+        return int(raw) if raw.isdigit() else raw
+
+
+USER_CACHE = UserCache(CONNECTOR_AUTH_CACHE_TTL, CONNECTOR_AUTH_CACHE_SIZE, CONNECTOR_AUTH_REDIS_URL)
+
+
+class CachedJWTAuthMixin:
+    """
+    get_user ninja_jwt с кэшем: подпись и срок токена проверяются на каждом запросе,
+    пользователь из базы читается не чаще раза в ttl.
+    Неактивные и удалённые пользователи не кэшируются
+    """
+
+    user_cache = USER_CACHE
+
+    def token_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def get_user(self, validated_token):
+        user_id = self.token_user_id(validated_token)
+        return self.user_cache.get(user_id) or self.load_user(validated_token, user_id)
+
+    def load_user(self, validated_token, user_id):
+        # проверки ninja_jwt: пользователь существует и активен
+        user = super().get_user(validated_token)
+        self.user_cache.set(user_id, user)
+        return user
+
+
+class CachedJWTAuth(CachedJWTAuthMixin, JWTAuth):
+    pass
+
+
+class AsyncCachedJWTAuth(CachedJWTAuthMixin, AsyncJWTAuth):
+    async def authenticate(self, request, token: str):
+        request.user = AnonymousUser()
+        # проверка токена - только вычисления, без поточного перехода sync_to_async
+        validated_token = self.get_validated_token(token)
+        user_id = self.token_user_id(validated_token)
+        user = self.user_cache.get(user_id)
+        if user is None:
+            user = await sync_to_async(self.load_user)(validated_token, user_id)
+        request.user = user
+        return user
+
+
+def user_changed(sender, instance, **kwargs):
+    invalidate_on_commit(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+def user_relations_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, get_user_model()):
+        invalidate_on_commit(getattr(instance, api_settings.USER_ID_FIELD))
+    else:
+        # изменились пользователи группы или права группы/разрешения со стороны Permission
+        invalidate_on_commit()
+
+
+def invalidate_on_commit(user_id=None):
+    """
+    Сброс кэша после коммита транзакции. Сброс внутри транзакции не помогает: параллельный запрос
+    успевает перечитать из базы ещё старые данные и снова положить их в кэш до конца TTL
+    """
+    transaction.on_commit(lambda: USER_CACHE.invalidate(user_id))
+
+
+def connect_signals():
+    """
+    Сброс кэша при изменении пользователя (is_active, пароль, флаги), его групп и прав, прав групп.
+    Вызывается из ConnectorConfig.ready
+    """
+    user_model = get_user_model()
+    post_save.connect(user_changed, sender=user_model, dispatch_uid='connector_auth_user_saved')
+    post_delete.connect(user_changed, sender=user_model, dispatch_uid='connector_auth_user_deleted')
+    for through in (user_model.groups.through, user_model.user_permissions.through, Group.permissions.through):
+        m2m_changed.connect(user_relations_changed, sender=through, dispatch_uid=f'connector_auth_{through.__name__}')
@@ -0,0 +1,108 @@
+import logging
+import re
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# служебные колонки снапшота рядом с каждой BLOB колонкой: photo__sha256, photo__size
+HASH_SUFFIX = '__sha256'
+SIZE_SUFFIX = '__size'
+INDEX_TABLE_SUFFIX = '__blob_'
+
+# поля select, которые отдаются ссылкой на blob, а не содержимым
+BLOB_ALIASES = ('photo', 'signature')
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def blob_columns(con, source: str) -> list:
+    """
+    BLOB колонки выражения FROM (таблица или read_parquet(...))
+    """
+    return [name for name, col_type, *_ in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall() if col_type == 'BLOB']
+
+
+def ref_columns_sql(columns) -> str:
+    """
+    Дополнительные колонки SELECT: sha256 и размер каждой BLOB колонки
+    """
+    return ''.join(f", sha256({c}) AS {c}{HASH_SUFFIX}, octet_length({c}) AS {c}{SIZE_SUFFIX}" for c in columns)
+
+
+def reference_sql(src: str) -> str:
+    """
+    Ссылка на blob в результате lookup вместо содержимого: {"sha256": ..., "size": ...}
+    """
+    return f"struct_pack(sha256 := {src}{HASH_SUFFIX}, size := {src}{SIZE_SUFFIX})"
+
+
+def inline_sql(src: str) -> str:
+    """
+    Содержимое blob в результате lookup, пока снапшот читается из parquet и индекса для /v1/blob нет:
+    {"base64": ..., "size": ...}. Хэш не считается - только для строк страницы
+    """
+    return f"struct_pack(base64 := base64({src}), size := octet_length({src}))"
+
+
+def index_table(schema_name: str, column: str) -> str:
+    return f"{schema_name}{INDEX_TABLE_SUFFIX}{column}"
+
+
+def build_index(con, schema_name: str, column: str):
+    """
+    Таблица (sha256, rid), отсортированная по sha256: поиск blob по хэшу читает один row group
+    """
+    start = time.time()
+    table = index_table(schema_name, column)
+    con.execute(f"""
+        CREATE TABLE {table} AS
+        SELECT {column}{HASH_SUFFIX} AS sha256, rowid AS rid FROM {schema_name}
+        WHERE {column} IS NOT NULL
+        ORDER BY sha256
+    """)
+    logger.info(f"Blob index {table}: {int((time.time() - start) * 1000)} ms")
+
+
+def indexed_columns(con) -> set:
+    """
+    {(схема, колонка)} с индексом blob по хэшу
+    """
+    tables = con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE contains(table_name, ?)", [INDEX_TABLE_SUFFIX]
+    ).fetchall()
+    return {tuple(name.split(INDEX_TABLE_SUFFIX, 1)) for (name,) in tables}
+
+
+def find(con, indexed, digest: str):
+    """
+    Содержимое blob по sha256 или None. Ищется только по индексам нативного снапшота:
+    поверх parquet колонка sha256 - выражение, и поиск считал бы хэш каждой строки на каждый запрос
+    """
+    for schema_name, column in sorted(indexed):
+        where = f"rowid IN (SELECT rid FROM {index_table(schema_name, column)} WHERE sha256 = $digest LIMIT 1)"
+        row = con.execute(f"SELECT {column} FROM {schema_name} WHERE {where} LIMIT 1", {"digest": digest}).fetchone()
+        if row is not None:
+            return row[0]
+    return None
+
+
+def parse_range(header: str, size: int):
+    """
+    Один диапазон заголовка Range: (start, end) включительно.
+    None - заголовок не поддерживается и отдаётся весь blob, ValueError - диапазон вне blob (416)
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # bytes=-500: последние 500 байт
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range {header} вне размера {size}")
+    return start, end
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class LookupCache:
+    """
+    Двухуровневый кэш результатов групп lookup:
+    LRU в памяти процесса с лимитом по байтам, за ним общий Redis.
+    Ключ включает версию снапшота, при смене версии локальный уровень очищается,
+    а записи старой версии в Redis истекают по ttl
+    """
+
+    prefix = 'connector:lookup:'
+    # после ошибки Redis не дёргаем его столько секунд, чтобы не копить таймауты
+    redis_backoff = 30
+
+    def __init__(self, max_bytes: int, redis_url: str = None, ttl: int = 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.2, socket_connect_timeout=0.2) if redis_url else None
+        self._local = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._redis_down_until = 0
+        self._lock = threading.Lock()
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def make_key(version, group_name, subject: dict, paging: dict) -> str:
+        """
+        Нормализованный ключ: порядок полей в запросе на него не влияет
+        """
+        raw = json.dumps([version, group_name, subject, paging], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def set_version(self, version):
+        with self._lock:
+            if version != self._version:
+                self._local.clear()
+                self._bytes = 0
+                self._version = version
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._local.get(key)
+            if value is not None:
+                self._local.move_to_end(key)
+                self.local_hits += 1
+        if value is not None:
+            metrics.CACHE_REQUESTS.labels('local').inc()
+            return value
+
+        if self._redis_available():
+            try:
+                value = self._redis.get(self.prefix + key)
+            except redis.RedisError as e:
+                self._redis_error(e)
+            if value is not None:
+                with self._lock:
+                    self.redis_hits += 1
+                metrics.CACHE_REQUESTS.labels('redis').inc()
+                self._put_local(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        metrics.CACHE_REQUESTS.labels('miss').inc()
+        return None
+
+    def set(self, key: str, value: bytes):
+        self._put_local(key, value)
+        if self._redis_available():
+            try:
+                self._redis.set(self.prefix + key, value, ex=self.ttl)
+            except redis.RedisError as e:
+                self._redis_error(e)
+
+    def _put_local(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._local.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._local[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._local.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_error(self, e):
+        with self._lock:
+            self.redis_errors += 1
+            self._redis_down_until = time.monotonic() + self.redis_backoff
+        logger.warning(f"Lookup cache redis error: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.local_hits + self.redis_hits
+            total = hits + self.misses
+            return {
+                "version": self._version,
+                "entries": len(self._local),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "local_hits": self.local_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "redis_errors": self.redis_errors,
+                "hit_ratio": round(hits / total, 4) if total else None,
+            }
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+from django.conf import settings
+
+# mapping.yml снапшота: читают API, задачи Celery и management-команды
+CFG_PATH = Path(f"{settings.SNAPSHOT_PATH}/mapping.yml").resolve()
+
+# Пул курсоров DuckDB: сколько запросов одного воркера выполняются параллельно
+# и сколько секунд запрос ждёт свободный курсор
+CONNECTOR_POOL_SIZE = getattr(settings, 'CONNECTOR_POOL_SIZE', 8)
+CONNECTOR_POOL_TIMEOUT = getattr(settings, 'CONNECTOR_POOL_TIMEOUT', 5)
+
+# Потоки для блокирующей работы асинхронных view (DuckDB, Arrow, подпись ответа)
+CONNECTOR_EXECUTOR_WORKERS = getattr(settings, 'CONNECTOR_EXECUTOR_WORKERS', 16)
+
+# Сколько скомпилированных запросов (группа, форма запроса) держать в LRU
+CONNECTOR_QUERY_CACHE_SIZE = getattr(settings, 'CONNECTOR_QUERY_CACHE_SIZE', 256)
+
+# Кэш результатов lookup: лимит LRU в памяти воркера (байты), Redis и время жизни записей в нём
+CONNECTOR_CACHE_BYTES = getattr(settings, 'CONNECTOR_CACHE_BYTES', 64 * 1024 * 1024)
+CONNECTOR_CACHE_REDIS_URL = getattr(settings, 'CONNECTOR_CACHE_REDIS_URL', getattr(settings, 'CELERY_BROKER_URL', None))
+CONNECTOR_CACHE_TTL = getattr(settings, 'CONNECTOR_CACHE_TTL', 3600)
+
+# Как часто (секунды) проверять mapping.yml, manifest.json и файл DuckDB на новую версию снапшота, 0 - не следить
+CONNECTOR_SNAPSHOT_POLL_INTERVAL = getattr(settings, 'CONNECTOR_SNAPSHOT_POLL_INTERVAL', 5)
+
+# Проверка хэшей снапшота: размер куска чтения файла (байты) и сколько файлов хэшировать параллельно
+CONNECTOR_HASH_CHUNK_SIZE = getattr(settings, 'CONNECTOR_HASH_CHUNK_SIZE', 8 * 1024 * 1024)
+CONNECTOR_HASH_WORKERS = getattr(settings, 'CONNECTOR_HASH_WORKERS', 4)
+
+# Фоновая проверка снапшота: Redis для статусов и сколько секунд хранить статус версии
+CONNECTOR_VERIFY_REDIS_URL = getattr(settings, 'CONNECTOR_VERIFY_REDIS_URL', getattr(settings, 'CELERY_BROKER_URL', None))
+CONNECTOR_VERIFY_TTL = getattr(settings, 'CONNECTOR_VERIFY_TTL', 7 * 24 * 3600)
+# Захват проверки версии одним воркером: TTL (секунды), пока проверка идёт, он продлевается.
+# Захват упавшего воркера истекает через это время
+CONNECTOR_VERIFY_LEASE_TTL = getattr(settings, 'CONNECTOR_VERIFY_LEASE_TTL', 60)
+
+# Выгрузка /v1/export: сколько строк DuckDB отдаёт в одном record batch потока
+CONNECTOR_EXPORT_BATCH_ROWS = getattr(settings, 'CONNECTOR_EXPORT_BATCH_ROWS', 10000)
+# Сколько выгрузок одного воркера идут одновременно. У выгрузок свои курсоры,
+# долгий поток не занимает курсоры lookup, сверх лимита /v1/export отвечает 503
+CONNECTOR_EXPORT_CONCURRENCY = getattr(settings, 'CONNECTOR_EXPORT_CONCURRENCY', 2)
+
+# Подпись ответов lookup: embedded - ответ целиком в JWS {"jwt": ...},
+# detached - тело как есть, JWS с sha256 тела в заголовке X-Body-Signature
+CONNECTOR_SIGNING_MODE = getattr(settings, 'CONNECTOR_SIGNING_MODE', 'embedded')
+
+# Время этапов lookup в ответе по флагу "debug": true в теле запроса
+CONNECTOR_DEBUG_TIMINGS = getattr(settings, 'CONNECTOR_DEBUG_TIMINGS', True)
+# Время этапов lookup дольше порога (мс) пишется в лог INFO, запросы с "debug": true - всегда
+CONNECTOR_TIMINGS_LOG_MS = getattr(settings, 'CONNECTOR_TIMINGS_LOG_MS', 1000)
+
+# Профиль EXPLAIN ANALYZE для запросов групп дольше порога (мс), 0 - выключено.
+# Один и тот же запрос профилируется не чаще раза в CONNECTOR_PROFILE_INTERVAL секунд
+CONNECTOR_PROFILE_SLOW_MS = getattr(settings, 'CONNECTOR_PROFILE_SLOW_MS', 0)
+CONNECTOR_PROFILE_INTERVAL = getattr(settings, 'CONNECTOR_PROFILE_INTERVAL', 300)
+# Сколько дней хранить QueryProfile (задача connector.tasks.query_profile_retention)
+CONNECTOR_PROFILE_RETENTION_DAYS = getattr(settings, 'CONNECTOR_PROFILE_RETENTION_DAYS', 14)
+
+# Доступ к /metrics: с токеном - по заголовку Authorization: Bearer <токен>,
+# без токена - только с адресов из CONNECTOR_METRICS_NETWORKS (Prometheus во внутренней сети).
+# Снаружи /metrics закрыт и в nginx.conf
+CONNECTOR_METRICS_TOKEN = getattr(settings, 'CONNECTOR_METRICS_TOKEN', None)
+CONNECTOR_METRICS_NETWORKS = getattr(
+    settings, 'CONNECTOR_METRICS_NETWORKS',
+    ('127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16')
+)
+
+# Кэш пользователей JWT в памяти воркера: сколько секунд и сколько пользователей держать,
+# Redis для рассылки сброса кэша остальным воркерам
+CONNECTOR_AUTH_CACHE_TTL = getattr(settings, 'CONNECTOR_AUTH_CACHE_TTL', 60)
+CONNECTOR_AUTH_CACHE_SIZE = getattr(settings, 'CONNECTOR_AUTH_CACHE_SIZE', 10000)
+CONNECTOR_AUTH_REDIS_URL = getattr(settings, 'CONNECTOR_AUTH_REDIS_URL', getattr(settings, 'CELERY_BROKER_URL', None))
@@ -0,0 +1,45 @@
+import io
+
+import pyarrow as pa
+
+from .serialize import join_rows
+
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_ARROW = 'arrow'
+CONTENT_TYPES = {
+    FORMAT_NDJSON: 'application/x-ndjson',
+    FORMAT_ARROW: 'application/vnd.apache.arrow.stream',
+}
+
+
+def ndjson_chunks(con, sql: str, params: dict, batch_rows: int):
+    """
+    Строки запроса в NDJSON кусками по record batch.
+    JSON строк собирает DuckDB (to_json) во время сканирования, в памяти только текущий batch
+    """
+    reader = con.execute(f"SELECT to_json(q) FROM ({sql}) q", params).fetch_record_batch(batch_rows)
+    for batch in reader:
+        if batch.num_rows:
+            yield join_rows(batch.column(0), b'\n') + b'\n'
+
+
+def arrow_chunks(con, sql: str, params: dict, batch_rows: int):
+    """
+    Строки запроса в формате Arrow IPC stream: схема, затем record batch по мере сканирования
+    """
+    reader = con.execute(sql, params).fetch_record_batch(batch_rows)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            yield _drain(sink)
+    # конец потока (end-of-stream маркер пишется при закрытии writer)
+    yield _drain(sink)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import redis
+
+
+logger = logging.getLogger(__name__)
+
+# статусы файла в отчёте проверки
+STATUS_OK = 'ok'
+STATUS_MISMATCH = 'mismatch'
+STATUS_MISSING = 'missing'
+STATUS_NO_HASH = 'no_hash'
+STATUS_ERROR = 'error'
+# файл датасета из manifest.derived.json, исходные файлы которого manifest.json больше не подтверждает
+STATUS_STALE = 'stale'
+
+# статусы фоновой проверки снапшота (connector.tasks.verify_snapshot)
+VERIFY_PENDING = 'pending'
+VERIFY_RUNNING = 'running'
+VERIFY_OK = 'ok'
+VERIFY_FAILED = 'failed'
+VERIFY_ERROR = 'error'
+VERIFY_DONE = (VERIFY_OK, VERIFY_FAILED)
+
+
+def file_sha256(path: Path, chunk_size: int) -> str:
+    """
+    sha256 файла по кускам chunk_size через mmap, файл целиком в память не читается.
+    hashlib отпускает GIL на больших кусках, поэтому файлы можно хэшировать в потоках параллельно
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            # пустой файл mmap не отображает
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for start in range(0, size, chunk_size):
+                    digest.update(view[start:start + chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def schema_files(storage_root: Path, schema_cfg: dict) -> list:
+    """
+    Файлы схемы относительно storage_root, как они записаны в manifest.json.
+    Если путь схемы - папка, берутся все parquet файлы внутри
+    """
+    path = storage_root / schema_cfg['path']
+    if path.is_dir():
+        return [p.relative_to(storage_root).as_posix() for p in sorted(path.rglob('*.parquet'))]
+    return [schema_cfg['path']]
+
+
+class HashVerifier:
+    """
+    Сверяет файлы снапшота с хэшами из manifest.json.
+    Посчитанные хэши запоминаются по (путь, размер, mtime),
+    повторная проверка неизменённых файлов их не перечитывает
+    """
+
+    def __init__(self, chunk_size: int, workers: int):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self._known = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path.resolve())
+        with self._lock:
+            known = self._known.get(key)
+        if known and known[:2] == (stat.st_size, stat.st_mtime_ns):
+            return known[2]
+
+        start = time.time()
+        digest = file_sha256(path, self.chunk_size)
+        logger.info(f"Hashed {path}: {stat.st_size} bytes, {int((time.time() - start) * 1000)} ms")
+        with self._lock:
+            self._known[key] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def check_file(self, storage_root: Path, name: str, expected) -> dict:
+        path = storage_root / name
+        result = {"file": name, "status": STATUS_OK}
+        if not expected:
+            result["status"] = STATUS_NO_HASH
+        elif not path.is_file():
+            result["status"] = STATUS_MISSING
+        else:
+            try:
+                real = self.digest(path)
+            except OSError as e:
+                result.update(status=STATUS_ERROR, detail=str(e))
+            else:
+                # в manifest хэш записан как "sha256:<hex>"
+                if real != expected.split(":", 1)[-1]:
+                    result["status"] = STATUS_MISMATCH
+        return result
+
+    def verify(self, cfg: dict, storage_root: Path, manifest_file: Path, derived_file: Path = None) -> dict:
+        """
+        Проверяет все файлы всех схем из cfg["schemas"].
+        Файлы датасетов из derived_file сверяются с его хэшами, только пока manifest.json
+        подтверждает те же исходные файлы, из которых датасет собран.
+        Возвращает {"ok": bool, "schemas": {схема: [{"file", "status"}, ...]}}
+        """
+        manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+        hashes = manifest.get("hashes", {})
+        stale = set()
+        if derived_file is not None and derived_file.exists():
+            derived = json.loads(derived_file.read_text(encoding="utf-8"))
+            for dataset in derived.get("datasets", {}).values():
+                attested = all(hashes.get(name) == expected for name, expected in dataset["source"].items())
+                for name, expected in dataset["hashes"].items():
+                    if attested:
+                        hashes.setdefault(name, expected)
+                    elif name not in hashes:
+                        stale.add(name)
+
+        tasks = [
+            (schema_name, name)
+            for schema_name, schema_cfg in cfg["schemas"].items()
+            for name in schema_files(storage_root, schema_cfg)
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hash') as executor:
+            results = executor.map(
+                lambda task: (
+                    {"file": task[1], "status": STATUS_STALE} if task[1] in stale
+                    else self.check_file(storage_root, task[1], hashes.get(task[1]))
+                ),
+                tasks
+            )
+            report = {schema_name: [] for schema_name in cfg["schemas"]}
+            for (schema_name, _), result in zip(tasks, results):
+                report[schema_name].append(result)
+
+        ok = all(r["status"] == STATUS_OK for files in report.values() for r in files)
+        return {"ok": ok, "schemas": report}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"known_files": len(self._known)}
+
+
+class VerificationStore:
+    """
+    Статусы проверки версий снапшота в Redis: пишет задача Celery, читает /v1/check-hash
+    """
+
+    prefix = 'connector:verify:'
+    lock_prefix = 'connector:verify:lock:'
+
+    def __init__(self, redis_url: str, ttl: int):
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, version: str):
+        raw = self._redis.get(self.prefix + version)
+        return json.loads(raw) if raw is not None else None
+
+    def publish(self, version: str, status: dict):
+        self._redis.set(self.prefix + version, json.dumps(status, ensure_ascii=False), ex=self.ttl)
+
+    def claim(self, version: str) -> bool:
+        """
+        Ставит статус pending, если проверки этой версии ещё не было.
+        True - проверку нужно запустить, иначе её уже запустил другой воркер
+        """
+        status = json.dumps({"version": version, "status": VERIFY_PENDING})
+        return bool(self._redis.set(self.prefix + version, status, ex=self.ttl, nx=True))
+
+    def forget(self, version: str):
+        self._redis.delete(self.prefix + version)
+
+    def running(self, version: str) -> bool:
+        """
+        Есть ли живой захват проверки версии. Статус running без захвата остался от упавшего воркера
+        """
+        return bool(self._redis.exists(self.lock_prefix + version))
+
+    @contextmanager
+    def lease(self, version: str, ttl: int):
+        """
+        Захват проверки версии (SET NX с TTL ttl секунд), выдаёт True, если захват получен.
+        Пока проверка идёт, фоновый поток продлевает TTL каждые ttl / 3 секунд.
+        Захват упавшего воркера истекает через ttl, и проверку забирает следующая задача
+        """
+        # токен захвата общий для потока задачи и потока продления
+        lock = self._redis.lock(self.lock_prefix + version, timeout=ttl, thread_local=False)
+        if not lock.acquire(blocking=False):
+            yield False
+            return
+
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(ttl / 3):
+                try:
+                    lock.reacquire()
+                except Exception as e:
+                    logger.warning(f"Snapshot {version} verification lease lost: {e}")
+                    return
+
+        thread = threading.Thread(target=heartbeat, name='verify-lease', daemon=True)
+        thread.start()
+        try:
+            yield True
+        finally:
+            stop.set()
+            thread.join()
+            try:
+                lock.release()
+            except Exception as e:
+                logger.warning(f"Snapshot {version} verification lease release failed: {e}")
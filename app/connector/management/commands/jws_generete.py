@@ -1,5 +1,5 @@
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
 from cryptography.hazmat.backends import default_backend
 import os
 from project.settings_local import SECRETS_PATH
@@ -14,21 +14,32 @@ if not os.path.exists(SECRETS_PATH):
 class Command(BaseCommand):
     help = "Моя кастомная команда"
 
-    def create_key(self):
-        # Генерация приватного ключа RSA 2048 бит
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
-        )
+    def create_key(self, alg):
+        if alg == "ES256":
+            # ECDSA P-256: подпись на порядок быстрее RS256, подпись 64 байта
+            private_key = ec.generate_private_key(ec.SECP256R1(), backend=default_backend())
+            private_format = serialization.PrivateFormat.PKCS8
+        elif alg == "EdDSA":
+            # Ed25519
+            private_key = ed25519.Ed25519PrivateKey.generate()
+            private_format = serialization.PrivateFormat.PKCS8
+        else:
+            # Генерация приватного ключа RSA 2048 бит
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048,
+                backend=default_backend()
+            )
+            private_format = serialization.PrivateFormat.TraditionalOpenSSL
 
-        # Сохраняем приватный ключ
-        with open(f"{SECRETS_PATH}/private.pem", "wb") as f:
+        # Сохраняем приватный ключ, через временный файл, чтобы воркеры не прочитали его наполовину
+        with open(f"{SECRETS_PATH}/private.pem.tmp", "wb") as f:
             f.write(private_key.private_bytes(
                 encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.TraditionalOpenSSL,
+                format=private_format,
                 encryption_algorithm=serialization.NoEncryption()
             ))
+        os.replace(f"{SECRETS_PATH}/private.pem.tmp", f"{SECRETS_PATH}/private.pem")
 
         # Извлекаем публичный ключ
         public_key = private_key.public_key()
@@ -40,14 +51,15 @@ class Command(BaseCommand):
                 format=serialization.PublicFormat.SubjectPublicKeyInfo
             ))
 
-        self.stdout.write(self.style.SUCCESS("RSA ключи успешно сгенерированы → private.pem и public.pem"))
+        self.stdout.write(self.style.SUCCESS(f"{alg} ключи успешно сгенерированы → private.pem и public.pem"))
 
     def add_arguments(self, parser):
         parser.add_argument("--name", type=str, help="Имя пользователя")
+        parser.add_argument("--alg", choices=["RS256", "ES256", "EdDSA"], default="RS256", help="Алгоритм подписи ответов")
 
     def handle(self, *args, **options):
         name = options.get("name")
         if name:
             self.stdout.write(self.style.SUCCESS(f"Hello, {name}!"))
         else:
-            self.create_key()
+            self.create_key(options["alg"])
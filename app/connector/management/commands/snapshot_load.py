@@ -0,0 +1,15 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from connector import snapshot
+from connector.config import CFG_PATH
+
+
+class Command(BaseCommand):
+    help = "Импортирует схемы снапшота из parquet в нативный файл DuckDB"
+
+    def handle(self, *args, **options):
+        cfg = snapshot.read_mapping(CFG_PATH)
+        db_path = snapshot.load_snapshot(cfg, Path(cfg["storage"]["root"]))
+        self.stdout.write(self.style.SUCCESS(f"Снапшот загружен → {db_path}"))
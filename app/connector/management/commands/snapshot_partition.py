@@ -0,0 +1,76 @@
+import json
+import os
+from pathlib import Path
+
+import duckdb
+from django.core.management.base import BaseCommand, CommandError
+
+from connector import partitions, snapshot
+from connector.config import CFG_PATH, CONNECTOR_HASH_CHUNK_SIZE, CONNECTOR_HASH_WORKERS
+from connector.integrity import HashVerifier, STATUS_OK, file_sha256, schema_files
+
+
+class Command(BaseCommand):
+    help = ("Переписывает схему снапшота в hive датасет с бакетами по колонке, "
+            "хэши его файлов пишет в manifest.derived.json")
+
+    def add_arguments(self, parser):
+        parser.add_argument("schema", type=str, help="Схема из mapping.yml, например document_images")
+        parser.add_argument("--column", type=str, required=True, help="Колонка бакетов, обычно ключ join")
+        parser.add_argument("--buckets", type=int, default=16, help="Число бакетов")
+        parser.add_argument("--output", type=str, help="Папка датасета относительно storage.root, по умолчанию <path>_hive")
+
+    def handle(self, *args, **options):
+        cfg = snapshot.read_mapping(CFG_PATH)
+        storage_root = Path(cfg["storage"]["root"])
+        schema_cfg = cfg["schemas"].get(options["schema"])
+        if schema_cfg is None:
+            raise CommandError(f"Схемы {options['schema']} нет в mapping.yml")
+
+        output = options["output"] or f"{schema_cfg['path'].rstrip('/')}_hive"
+        target = storage_root / output
+        if target.exists():
+            raise CommandError(f"{target} уже существует")
+
+        # датасет собирается только из файлов, которые подтверждает manifest.json издателя
+        manifest_file = snapshot.manifest_path(cfg, storage_root)
+        if not manifest_file.exists():
+            raise CommandError(f"{manifest_file} не найден")
+        hashes = json.loads(manifest_file.read_text(encoding="utf-8")).get("hashes", {})
+        verifier = HashVerifier(CONNECTOR_HASH_CHUNK_SIZE, CONNECTOR_HASH_WORKERS)
+        source = {}
+        for name in schema_files(storage_root, schema_cfg):
+            result = verifier.check_file(storage_root, name, hashes.get(name))
+            if result["status"] != STATUS_OK:
+                raise CommandError(f"{name}: {result['status']} по {manifest_file.name}")
+            source[name] = hashes[name]
+
+        con = duckdb.connect()
+        try:
+            partitions.write_dataset(
+                con, snapshot.schema_source(storage_root, schema_cfg), str(target), options["column"], options["buckets"]
+            )
+        finally:
+            con.close()
+
+        # manifest.json издателя не меняется: хэши датасета посчитаны здесь и лежат отдельно
+        # вместе с хэшами исходных файлов, по которым проверка решает, актуален ли датасет
+        derived_file = snapshot.derived_manifest_path(cfg, storage_root)
+        derived = json.loads(derived_file.read_text(encoding="utf-8")) if derived_file.exists() else {}
+        derived.setdefault("datasets", {})[output] = {
+            "source": source,
+            "hashes": {
+                path.relative_to(storage_root).as_posix(): f"sha256:{file_sha256(path, CONNECTOR_HASH_CHUNK_SIZE)}"
+                for path in sorted(target.rglob("*.parquet"))
+            },
+        }
+        tmp_file = derived_file.with_name(derived_file.name + ".tmp")
+        tmp_file.write_text(json.dumps(derived, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_file, derived_file)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Датасет записан → {target}. В mapping.yml:\n"
+            f"  {options['schema']}:\n"
+            f"    path: {output}\n"
+            f"    partition_by: {{column: {options['column']}, buckets: {options['buckets']}}}"
+        ))
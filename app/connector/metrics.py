@@ -0,0 +1,123 @@
+import asyncio
+import functools
+import hmac
+import ipaddress
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+
+# Метрики коннектора для Prometheus.
+# Под gunicorn каждый воркер пишет свои значения в файлы PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py),
+# /metrics любого воркера отдаёт сумму по всем процессам
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROWS_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(9))  # 1 KB .. 64 MB
+
+REQUEST_SECONDS = Histogram(
+    'connector_request_seconds', 'Время ответа endpoint коннектора', ['endpoint'], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter('connector_requests', 'Ответы endpoint коннектора по статусу', ['endpoint', 'status'])
+RESPONSE_BYTES = Histogram(
+    'connector_response_bytes', 'Размер тела ответа endpoint', ['endpoint'], buckets=BYTES_BUCKETS
+)
+
+GROUP_SECONDS = Histogram(
+    'connector_group_seconds', 'Время группы lookup, включая кэш и ожидание курсора', ['group'],
+    buckets=LATENCY_BUCKETS
+)
+GROUP_ROWS = Histogram('connector_group_rows', 'Строк в странице группы', ['group'], buckets=ROWS_BUCKETS)
+GROUP_STATUS = Counter('connector_group_results', 'Результаты групп lookup', ['group', 'status'])
+
+POOL_WAIT_SECONDS = Histogram(
+    'connector_pool_wait_seconds', 'Ожидание свободного курсора DuckDB', buckets=LATENCY_BUCKETS
+)
+POOL_TIMEOUTS = Counter('connector_pool_timeouts', 'Курсор DuckDB не освободился за timeout пула')
+
+# local, redis, miss; hit ratio = sum(local, redis) / sum(всех)
+CACHE_REQUESTS = Counter('connector_cache_requests', 'Обращения к кэшу результатов групп', ['result'])
+
+SIGN_SECONDS = Histogram('connector_sign_seconds', 'Подпись ответа lookup', buckets=LATENCY_BUCKETS)
+
+# метка групп, которых нет в mapping.yml: имена групп приходят от клиента,
+# и каждое новое значение метки - новый ряд (в multiprocess режиме ещё и на диске)
+UNKNOWN_GROUP = 'unknown'
+
+
+def group_label(groups: dict, group_name: str) -> str:
+    return group_name if group_name in groups else UNKNOWN_GROUP
+
+
+def allowed(request, token: str = None, networks=()) -> bool:
+    """
+    Можно ли отдать /metrics: по токену, если он задан, иначе по адресу клиента
+    """
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in networks)
+
+
+def render():
+    """
+    (тело, content type) для /metrics
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def observe_response(endpoint: str, response, seconds: float):
+    """
+    Время, статус и размер ответа view: HttpResponse или (status, body) ninja
+    """
+    REQUEST_SECONDS.labels(endpoint).observe(seconds)
+    if isinstance(response, tuple):
+        status = response[0]
+    else:
+        status = getattr(response, 'status_code', 200)
+        # у потокового ответа размер считает сам поток, см. views.export_chunks
+        if not getattr(response, 'streaming', True):
+            RESPONSE_BYTES.labels(endpoint).observe(len(response.content))
+    REQUESTS.labels(endpoint, str(status)).inc()
+
+
+def track(endpoint: str):
+    """
+    Декоратор view (sync или async) для метрик endpoint, ставится под @router.get/post
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    response = await view(*args, **kwargs)
+                except Exception:
+                    REQUESTS.labels(endpoint, '500').inc()
+                    raise
+                observe_response(endpoint, response, time.perf_counter() - start)
+                return response
+        else:
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    response = view(*args, **kwargs)
+                except Exception:
+                    REQUESTS.labels(endpoint, '500').inc()
+                    raise
+                observe_response(endpoint, response, time.perf_counter() - start)
+                return response
+        return wrapper
+    return decorator
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(db_index=True, max_length=100)),
+                ('snapshot_version', models.CharField(max_length=32)),
+                ('duration_ms', models.FloatField()),
+                ('sql', models.TextField()),
+                ('params', models.JSONField(default=dict)),
+                ('plan', models.TextField()),
+                ('create_datetime', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Профили запросов',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ('-create_datetime',),
+            },
+        ),
+    ]
@@ -1,3 +1,21 @@
 from django.db import models
 
 
+class QueryProfile(models.Model):
+    """
+    Профиль EXPLAIN ANALYZE медленного запроса группы (см. profiling.SlowQueryProfiler)
+    """
+    group_name = models.CharField(max_length=100, db_index=True)
+    snapshot_version = models.CharField(max_length=32)
+    duration_ms = models.FloatField()
+    sql = models.TextField()
+    params = models.JSONField(default=dict)
+    plan = models.TextField()
+    create_datetime = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created at')
+
+    def __str__(self):
+        return f'{self.group_name} {self.duration_ms} ms'
+
+    class Meta:
+        ordering = ('-create_datetime',)
+        verbose_name_plural = verbose_name = "Профили запросов"
@@ -0,0 +1,67 @@
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZE = 3
+NGRAM_TABLE_SUFFIX = '__ngram_'
+
+
+def index_table(schema_name: str, column: str) -> str:
+    """
+    Имя таблицы n-gram индекса колонки: persons__ngram_lastname
+    """
+    return f"{schema_name}{NGRAM_TABLE_SUFFIX}{column}"
+
+
+def build_index(con, schema_name: str, column: str):
+    """
+    Строит инвертированный индекс (gram, rid) по колонке нативной таблицы снапшота.
+    rid - rowid строки таблицы, сортировка по gram сужает чтение при пробе индекса
+    """
+    start = time.time()
+    table = index_table(schema_name, column)
+    con.execute(f"""
+        CREATE TABLE {table} AS
+        SELECT DISTINCT gram, rid FROM (
+            SELECT rowid AS rid,
+                   unnest([substr({column}, i, {NGRAM_SIZE}) for i in range(1, length({column}) - {NGRAM_SIZE - 2})]) AS gram
+            FROM {schema_name}
+        )
+        ORDER BY gram, rid
+    """)
+    rows = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    logger.info(f"N-gram index {table}: {rows} rows, {int((time.time() - start) * 1000)} ms")
+
+
+def indexed_columns(con) -> set:
+    """
+    Какие колонки снапшота проиндексированы: {(схема, колонка)}
+    """
+    tables = con.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE contains(table_name, ?)", [NGRAM_TABLE_SUFFIX]
+    ).fetchall()
+    return {tuple(name.split(NGRAM_TABLE_SUFFIX, 1)) for (name,) in tables}
+
+
+def usable(value: str) -> bool:
+    """
+    Индекс применим, если в значении есть хотя бы одна n-грамма и нет LIKE-шаблонов
+    """
+    return len(value) >= NGRAM_SIZE and '%' not in value and '_' not in value
+
+
+def ngrams(value: str) -> list:
+    return sorted({value[i:i + NGRAM_SIZE] for i in range(len(value) - NGRAM_SIZE + 1)})
+
+
+def probe_condition(schema_name: str, column: str, param: str) -> str:
+    """
+    Условие WHERE: строка содержит все n-граммы значения из параметра param (список).
+    Точная проверка LIKE остаётся в запросе, индекс только сужает кандидатов
+    """
+    return (f"{schema_name}.rowid IN ("
+            f"SELECT rid FROM {index_table(schema_name, column)} "
+            f"WHERE gram IN (SELECT unnest({param})) "
+            f"GROUP BY rid HAVING COUNT(*) = len({param}))")
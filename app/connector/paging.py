@@ -0,0 +1,81 @@
+import json
+import logging
+
+from .timing import stage
+
+
+logger = logging.getLogger(__name__)
+
+# режимы подсчёта total в блоке paging запроса
+TOTAL_EXACT = 'exact'
+TOTAL_ESTIMATE = 'estimate'
+TOTAL_NONE = 'none'
+TOTAL_MODES = (TOTAL_EXACT, TOTAL_ESTIMATE, TOTAL_NONE)
+
+# служебная колонка с оконным COUNT(*), вырезается из результата
+TOTAL_COLUMN = '__total'
+
+
+def page_sql(sql: str, window: str, with_total: bool) -> str:
+    """
+    Страница произвольного запроса: LIMIT/OFFSET поверх него, при with_total - оконный COUNT(*)
+    """
+    total = f", COUNT(*) OVER () AS {TOTAL_COLUMN}" if with_total else ""
+    return f"SELECT *{total} FROM ({sql}) {window}"
+
+
+def fetch_page(con, query, params: dict, limit: int, offset: int, total_mode: str = TOTAL_EXACT, timer=None):
+    """
+    Получает страницу результата и total за один проход по данным.
+    exact    - total считается оконным COUNT(*) OVER () в том же запросе
+    estimate - страница берётся как limit + 1 строк, total - оценка планировщика DuckDB
+    none     - только limit + 1 строк, total не считается
+    query - SQL или utils.CompiledQuery, который сам ставит LIMIT/OFFSET внутрь запроса (см. CompiledQuery.page_sql)
+    timer - timing.StageTimer для этапов page и count
+    Возвращает (arrow таблица страницы, total, has_next)
+    """
+    if isinstance(query, str):
+        sql, paged = query, lambda window, with_total: page_sql(query, window, with_total)
+    else:
+        sql, paged = query.sql, query.page_sql
+
+    if total_mode == TOTAL_EXACT:
+        with stage(timer, 'page'):
+            table = con.execute(paged(f"LIMIT {limit} OFFSET {offset}", True), params).fetch_arrow_table()
+        if table.num_rows:
+            total = table.column(TOTAL_COLUMN)[0].as_py()
+            table = table.drop_columns([TOTAL_COLUMN])
+        elif offset:
+            # страница за концом выборки, оконной колонке неоткуда взяться
+            with stage(timer, 'count'):
+                total = con.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+        else:
+            total = 0
+        return table, total, offset + table.num_rows < total
+
+    with stage(timer, 'page'):
+        table = con.execute(paged(f"LIMIT {limit + 1} OFFSET {offset}", False), params).fetch_arrow_table()
+    has_next = table.num_rows > limit
+    if has_next:
+        table = table.slice(0, limit)
+    elif table.num_rows or not offset:
+        # последняя страница - total известен точно без подсчёта
+        return table, offset + table.num_rows, False
+
+    total = None
+    if total_mode == TOTAL_ESTIMATE:
+        with stage(timer, 'count'):
+            total = estimate_total(con, sql, params)
+    return table, total, has_next
+
+
+def estimate_total(con, sql: str, params: dict):
+    """
+    Оценка количества строк по плану запроса (Estimated Cardinality корневого узла)
+    """
+    try:
+        plan = json.loads(con.execute(f"EXPLAIN (FORMAT JSON) {sql}", params).fetchone()[1])
+        return int(plan[0]["extra_info"]["Estimated Cardinality"])
+    except Exception as e:
+        logger.warning(f"Failed to estimate total: {e}")
+        return None
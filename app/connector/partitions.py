@@ -0,0 +1,60 @@
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# колонка номера бакета в hive датасете: document_images/person_id__bucket=3/*.parquet
+BUCKET_SUFFIX = '__bucket'
+
+
+def partition_spec(schema_cfg: dict):
+    """
+    (колонка, число бакетов) из partition_by схемы в mapping.yml или None:
+    document_images:
+      path: document_images
+      partition_by: {column: person_id, buckets: 16}
+    """
+    spec = schema_cfg.get("partition_by")
+    if not spec:
+        return None
+    return spec["column"], int(spec["buckets"])
+
+
+def bucket_column(column: str) -> str:
+    return f"{column}{BUCKET_SUFFIX}"
+
+
+def bucket_sql(expr: str, buckets: int) -> str:
+    """
+    Номер бакета значения. md5 стабилен между версиями DuckDB, в отличие от hash()
+    """
+    return f"CAST(md5_number(CAST({expr} AS VARCHAR)) % {buckets} AS INTEGER)"
+
+
+def write_dataset(con, source: str, target: str, column: str, buckets: int):
+    """
+    Пишет hive датасет target/<column>__bucket=N/*.parquet из выражения FROM source,
+    строки внутри бакета отсортированы по column
+    """
+    start = time.time()
+    con.execute(f"""
+        COPY (
+            SELECT *, {bucket_sql(column, buckets)} AS {bucket_column(column)}
+            FROM {source}
+            ORDER BY {bucket_column(column)}, {column}
+        ) TO '{target}' (FORMAT parquet, PARTITION_BY ({bucket_column(column)}))
+    """)
+    logger.info(f"Partitioned dataset {target}: {buckets} buckets by {column}, {int((time.time() - start) * 1000)} ms")
+
+
+def join_keys(join_cfg: dict):
+    """
+    (ключ главной таблицы, колонка присоединяемой схемы) из условия join on: persons.person_id = document_images.person_id
+    """
+    prefix = f"{join_cfg['schema']}."
+    left, right = (side.strip() for side in join_cfg['on'].split('=', 1))
+    if left.startswith(prefix):
+        left, right = right, left
+    return left, right[len(prefix):]
+
@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """
+    Свободный курсор не освободился за отведённое время
+    """
+
+
+class CursorPool:
+    """
+    Пул курсоров над одним экземпляром базы DuckDB.
+    Каждый запрос (поток) берёт свой курсор, поэтому запросы
+    выполняются параллельно, а не по очереди на одном соединении
+    """
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, size: int, timeout: float):
+        self.con = con
+        self.size = size
+        self.timeout = timeout
+        self._cursors = queue.LifoQueue()
+        for _ in range(size):
+            self._cursors.put(con.cursor())
+
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @contextmanager
+    def cursor(self):
+        """
+        Выдаёт курсор на время блока with, ждёт не дольше self.timeout
+        """
+        start = time.perf_counter()
+        try:
+            cur = self._cursors.get_nowait()
+            waited = 0.0
+        except queue.Empty:
+            try:
+                cur = self._cursors.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self.timeouts += 1
+                metrics.POOL_TIMEOUTS.inc()
+                logger.warning(f"DuckDB pool timeout after {self.timeout}s (size {self.size})")
+                raise PoolTimeout(f"Нет свободного курсора DuckDB за {self.timeout} с")
+            waited = time.perf_counter() - start
+        metrics.POOL_WAIT_SECONDS.observe(waited)
+
+        with self._lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            yield cur
+        finally:
+            self._cursors.put(cur)
+
+    def close(self):
+        """
+        Закрывает курсоры, вызывается когда запросов на пуле больше нет
+        """
+        while True:
+            try:
+                self._cursors.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "available": self._cursors.qsize(),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_ms_total": int(self.wait_seconds * 1000),
+                "wait_ms_max": int(self.max_wait_seconds * 1000),
+            }
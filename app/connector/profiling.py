@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+
+def redact_params(params: dict) -> dict:
+    """
+    Параметры запроса без значений: в них данные субъекта (ФИО, номера документов).
+    Для профиля достаточно имени, типа и длины: {"p0": "str(10)", "g1": "list(4)"}
+    """
+    redacted = {}
+    for name, value in params.items():
+        kind = type(value).__name__
+        redacted[name] = f"{kind}({len(value)})" if isinstance(value, (str, bytes, list, tuple)) else kind
+    return redacted
+
+
+class SlowQueryProfiler:
+    """
+    Сохраняет EXPLAIN ANALYZE запросов групп дольше threshold_ms в QueryProfile.
+    Профиль снимается повторным выполнением запроса в фоне на executor, не задерживая ответ.
+    Один и тот же запрос (версия снапшота, группа, SQL) профилируется не чаще раза в interval секунд,
+    помнится не больше max_keys последних запросов. Значения параметров не сохраняются, см. redact_params
+    """
+
+    max_keys = 1024
+
+    def __init__(self, threshold_ms: float, interval: float, executor):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.executor = executor
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+
+    def maybe_capture(self, snap, group_name: str, sql: str, params: dict, duration_ms: float):
+        if not self.threshold_ms or duration_ms < self.threshold_ms:
+            return
+
+        key = (snap.version, group_name, sql)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, -self.interval) < self.interval:
+                return
+            self._last[key] = now
+            self._last.move_to_end(key)
+            # в начале самые старые: запросы, профилированные раньше interval, больше не ограничиваются
+            while self._last and (
+                len(self._last) > self.max_keys or now - next(iter(self._last.values())) >= self.interval
+            ):
+                self._last.popitem(last=False)
+
+        # в лог - только запросы, которые профилируются: не чаще раза в interval на запрос
+        logger.warning(f"Slow query {group_name}: {duration_ms} ms")
+
+        # версия снапшота держится до конца профилирования
+        snap.acquire()
+        self.executor.submit(self._capture, snap, group_name, sql, params, duration_ms)
+
+    def _capture(self, snap, group_name, sql, params, duration_ms):
+        from .models import QueryProfile
+
+        close_old_connections()
+        try:
+            with snap.pool.cursor() as con:
+                rows = con.execute(f"EXPLAIN ANALYZE {sql}", params).fetchall()
+            QueryProfile.objects.create(
+                group_name=group_name,
+                snapshot_version=snap.version,
+                duration_ms=duration_ms,
+                sql=sql,
+                params=redact_params(params),
+                plan="\n".join(plan for _, plan in rows),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to profile {group_name}: {e}")
+        finally:
+            snap.release()
+            close_old_connections()
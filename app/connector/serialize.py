@@ -0,0 +1,81 @@
+import decimal
+
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# готовый JSON (bytes), вставляется в ответ без повторной сериализации
+Fragment = orjson.Fragment
+
+
+def table_to_json(con, table: pa.Table) -> bytes:
+    """
+    JSON массив строк arrow таблицы без промежуточных python dict на строку:
+    строки кодирует to_json DuckDB поверх arrow таблицы, склейка - arrow compute.
+    DECIMAL и TIMESTAMP приводятся к виду dumps, см. json_sql
+    """
+    if not table.num_rows:
+        return b'[]'
+    projection = ', '.join(f"{json_sql(quote(field.name), field.type)} AS {quote(field.name)}" for field in table.schema)
+    sql = f'SELECT to_json(page) FROM (SELECT {projection} FROM page) page'
+    rows = con.from_arrow(table).query('page', sql).fetch_arrow_table()
+    return b'[' + join_rows(rows.column(0), b',') + b']'
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def json_sql(src: str, arrow_type) -> str:
+    """
+    Выражение колонки для to_json с тем же видом значений, что у dumps:
+    DECIMAL - строкой ("12.50", без потери точности), TIMESTAMP - ISO 8601 ("2020-01-02T03:04:05").
+    to_json отдал бы DECIMAL числом и время через пробел. Вложенные списки и структуры (join) - рекурсивно
+    """
+    if not needs_cast(arrow_type):
+        return src
+    if pa.types.is_decimal(arrow_type):
+        return f"CAST({src} AS VARCHAR)"
+    if pa.types.is_timestamp(arrow_type):
+        return f"replace(CAST({src} AS VARCHAR), ' ', 'T')"
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return f"list_transform({src}, v -> {json_sql('v', arrow_type.value_type)})"
+    fields = ', '.join(
+        f"{quote(field.name)} := {json_sql(f'{src}.{quote(field.name)}', field.type)}" for field in arrow_type
+    )
+    return f"CASE WHEN {src} IS NULL THEN NULL ELSE struct_pack({fields}) END"
+
+
+def needs_cast(arrow_type) -> bool:
+    if pa.types.is_decimal(arrow_type) or pa.types.is_timestamp(arrow_type):
+        return True
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return needs_cast(arrow_type.value_type)
+    if pa.types.is_struct(arrow_type):
+        return any(needs_cast(field.type) for field in arrow_type)
+    return False
+
+
+def join_rows(rows, sep: bytes) -> bytes:
+    """
+    Склеивает строковую arrow колонку через sep одним вызовом arrow compute
+    """
+    if isinstance(rows, pa.ChunkedArray):
+        rows = rows.combine_chunks()
+    joined = pc.binary_join(pa.ListArray.from_arrays(pa.array([0, len(rows)], pa.int32()), rows), sep.decode())[0]
+    return joined.as_buffer().to_pybytes()
+
+
+def _default(obj):
+    # как в table_to_json: DECIMAL строкой
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj) -> bytes:
+    """
+    Сериализация ответа через orjson, Fragment вставляются как есть
+    """
+    return orjson.dumps(obj, default=_default)
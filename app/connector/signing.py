@@ -0,0 +1,91 @@
+import hashlib
+import logging
+import os
+import threading
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from .serialize import dumps
+
+
+logger = logging.getLogger(__name__)
+
+# режимы подписи ответа
+SIGN_EMBEDDED = 'embedded'
+SIGN_DETACHED = 'detached'
+SIGN_MODES = (SIGN_EMBEDDED, SIGN_DETACHED)
+
+# заголовок ответа с detached подписью
+SIGNATURE_HEADER = 'X-Body-Signature'
+
+
+def key_algorithm(key) -> str:
+    """
+    Алгоритм JWS по типу приватного ключа
+    """
+    if isinstance(key, rsa.RSAPrivateKey):
+        return 'RS256'
+    if isinstance(key, ec.EllipticCurvePrivateKey) and isinstance(key.curve, ec.SECP256R1):
+        return 'ES256'
+    if isinstance(key, ed25519.Ed25519PrivateKey):
+        return 'EdDSA'
+    raise ValueError(f"Неподдерживаемый тип ключа: {type(key).__name__}")
+
+
+class ResponseSigner:
+    """
+    Подпись ответов ключом SECRETS_PATH/private.pem.
+    Разобранный ключ держится в памяти и перечитывается только при изменении файла,
+    алгоритм (RS256, ES256, EdDSA) определяется по типу ключа.
+    embedded - ответ целиком упаковывается в JWS {"jwt": "<token>"}
+    detached - тело отдаётся как есть, в заголовке X-Body-Signature JWS с отделённым
+               payload (RFC 7515, приложение F): подписывается sha256 тела в hex
+    """
+
+    def __init__(self, secrets_path: str, mode: str = SIGN_EMBEDDED):
+        self.key_path = f"{secrets_path}/private.pem" if secrets_path else None
+        self.mode = mode
+        self._key = None
+        self._algorithm = None
+        self._key_stamp = None
+        self._lock = threading.Lock()
+
+    def key(self):
+        """
+        (ключ, алгоритм) или (None, None), если ключа нет
+        """
+        if not self.key_path:
+            return None, None
+        try:
+            stat = os.stat(self.key_path)
+        except FileNotFoundError:
+            return None, None
+
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._key_stamp:
+            with self._lock:
+                if stamp != self._key_stamp:
+                    with open(self.key_path, "rb") as f:
+                        key = serialization.load_pem_private_key(f.read(), password=None)
+                    self._key, self._algorithm = key, key_algorithm(key)
+                    self._key_stamp = stamp
+                    logger.info(f"Signing key loaded: {self._algorithm}")
+        return self._key, self._algorithm
+
+    def sign(self, body: bytes):
+        """
+        Возвращает (тело ответа, заголовки). Без ключа тело не подписывается
+        """
+        key, algorithm = self.key()
+        if key is None:
+            return body, {}
+
+        if self.mode == SIGN_DETACHED:
+            digest = hashlib.sha256(body).hexdigest().encode()
+            token = jwt.api_jws.encode(digest, key, algorithm, headers={"dig": "sha256"}, is_payload_detached=True)
+            return body, {SIGNATURE_HEADER: token}
+
+        token = jwt.api_jws.encode(body, key, algorithm)
+        return dumps({"jwt": token}), {}
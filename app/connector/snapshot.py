@@ -0,0 +1,419 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+import yaml
+
+from . import blobs, ngram, partitions
+from .pool import CursorPool
+from .utils import QueryCompiler
+
+
+logger = logging.getLogger(__name__)
+
+# служебная таблица нативного файла: по какому manifest.json он собран и id сборки
+BUILD_TABLE = '__snapshot_build'
+
+
+def schema_glob(storage_root: Path, schema_cfg: dict) -> str:
+    """
+    Путь или glob parquet файлов схемы из mapping.yml.
+    Если путь схемы - папка, берутся все parquet файлы внутри,
+    для схемы с partition_by - файлы hive бакетов <колонка>__bucket=N/
+    """
+    parquet_path = (storage_root / schema_cfg['path']).resolve()
+    if partitions.partition_spec(schema_cfg):
+        return f"{parquet_path}/*/*.parquet"
+    if parquet_path.is_dir():
+        return f"{parquet_path}/*.parquet"
+    return str(parquet_path)
+
+
+def schema_source(storage_root: Path, schema_cfg: dict) -> str:
+    """
+    Возвращает выражение read_parquet(...) для схемы из mapping.yml
+    """
+    if partitions.partition_spec(schema_cfg):
+        return f"read_parquet('{schema_glob(storage_root, schema_cfg)}', hive_partitioning = true)"
+    return f"read_parquet('{schema_glob(storage_root, schema_cfg)}')"
+
+
+def snapshot_db_path(cfg: dict, storage_root: Path) -> Path:
+    """
+    Путь к нативному файлу DuckDB снапшота (storage.database в mapping.yml).
+    Это ссылка на файл текущей сборки snapshot.duckdb.<build_id>, см. load_snapshot
+    """
+    return storage_root / cfg["storage"].get("database", "snapshot.duckdb")
+
+
+def build_files(db_path: Path) -> list:
+    """
+    Файлы сборок рядом с db_path: snapshot.duckdb.<build_id> и их .wal
+    """
+    pattern = re.compile(rf'^{re.escape(db_path.name)}\.[0-9a-f]{{32}}(\.wal)?$')
+    return [path for path in db_path.parent.iterdir() if pattern.match(path.name)]
+
+
+def manifest_path(cfg: dict, storage_root: Path) -> Path:
+    return storage_root / cfg["storage"].get("manifest", "manifest.json")
+
+
+def derived_manifest_path(cfg: dict, storage_root: Path) -> Path:
+    """
+    Хэши датасетов, которые собраны локально из файлов снапшота (snapshot_partition).
+    Отдельно от manifest.json: хэши в нём посчитаны нами, а не издателем снапшота
+    """
+    return storage_root / cfg["storage"].get("derived_manifest", "manifest.derived.json")
+
+
+def manifest_digest(cfg: dict, storage_root: Path) -> str:
+    """
+    sha256 manifest.json, пустая строка если манифеста нет
+    """
+    try:
+        return hashlib.sha256(manifest_path(cfg, storage_root).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return ''
+
+
+def read_build(con) -> dict:
+    """
+    {"manifest_sha256", "build_id"} нативного файла, None - таблицы сборки нет (старый файл или parquet)
+    """
+    if not con.execute("SELECT 1 FROM duckdb_tables() WHERE table_name = ?", [BUILD_TABLE]).fetchone():
+        return None
+    manifest_sha256, build_id = con.execute(f"SELECT manifest_sha256, build_id FROM {BUILD_TABLE}").fetchone()
+    return {"manifest_sha256": manifest_sha256, "build_id": build_id}
+
+
+def load_snapshot(cfg: dict, storage_root: Path) -> Path:
+    """
+    Импортирует все схемы из cfg["schemas"] в нативный файл DuckDB,
+    таблицы называются так же как схемы.
+    Если у схемы задан sort_by, строки кластеризуются по этим ключам:
+    exact и prefix поиск по ним читает только несколько row group.
+    Для колонок из ngram_index схемы строится n-gram индекс (см. ngram.build_index).
+    У BLOB колонок рядом хранятся sha256 и размер, lookup отдаёт ссылку вместо содержимого (см. blobs).
+    Каждая сборка пишется в свой файл snapshot.duckdb.<build_id>, затем ссылка snapshot.duckdb
+    атомарно переключается на него. Воркеры со старым файлом дочитывают его до переподключения;
+    отдельный путь нужен и потому, что DuckDB отдаёт уже открытый в процессе экземпляр базы по тому же пути.
+    Хранятся текущая и предыдущая сборки.
+    В BUILD_TABLE записывается хэш manifest.json на момент начала импорта и id сборки
+    """
+    db_path = snapshot_db_path(cfg, storage_root)
+    digest = manifest_digest(cfg, storage_root)
+    build_id = uuid.uuid4().hex
+    build_path = db_path.with_name(f"{db_path.name}.{build_id}")
+
+    con = duckdb.connect(str(build_path))
+    try:
+        for schema_name, schema_cfg in cfg["schemas"].items():
+            start = time.time()
+            source = schema_source(storage_root, schema_cfg)
+            blob_columns = blobs.blob_columns(con, source)
+            sql = f"CREATE TABLE {schema_name} AS SELECT *{blobs.ref_columns_sql(blob_columns)} FROM {source}"
+            spec = partitions.partition_spec(schema_cfg)
+            if schema_cfg.get("sort_by"):
+                sql += f" ORDER BY {', '.join(schema_cfg['sort_by'])}"
+            elif spec:
+                # как в датасете: фильтр по бакетам отсекает row group нативной таблицы
+                sql += f" ORDER BY {partitions.bucket_column(spec[0])}, {spec[0]}"
+            con.execute(sql)
+            rows = con.execute(f"SELECT COUNT(*) FROM {schema_name}").fetchone()[0]
+            logger.info(f"Snapshot table {schema_name}: {rows} rows, {int((time.time() - start) * 1000)} ms")
+            for column in schema_cfg.get("ngram_index", []):
+                ngram.build_index(con, schema_name, column)
+            for column in blob_columns:
+                blobs.build_index(con, schema_name, column)
+        con.execute(
+            f"CREATE TABLE {BUILD_TABLE} AS SELECT $manifest AS manifest_sha256, $build AS build_id, now() AS built_at",
+            {"manifest": digest, "build": build_id}
+        )
+        con.execute("CHECKPOINT")
+    except BaseException:
+        con.close()
+        for path in (build_path, build_path.with_name(build_path.name + '.wal')):
+            path.unlink(missing_ok=True)
+        raise
+    con.close()
+
+    previous = os.readlink(db_path) if db_path.is_symlink() else None
+    link_path = db_path.with_name(db_path.name + '.link')
+    link_path.unlink(missing_ok=True)
+    os.symlink(build_path.name, link_path)
+    os.replace(link_path, db_path)
+
+    keep = {build_path.name, previous, f"{previous}.wal"}
+    for path in build_files(db_path):
+        if path.name not in keep:
+            path.unlink(missing_ok=True)
+    logger.info(f"Snapshot build {build_id} → {db_path}")
+    return db_path
+
+
+def open_native(cfg: dict, storage_root: Path, digest: str):
+    """
+    Соединение только на чтение с файлом текущей сборки, если он собран по manifest.json с хэшем digest,
+    иначе None: устаревший файл не должен скрывать опубликованные после него данные
+    """
+    db_path = snapshot_db_path(cfg, storage_root)
+    if not db_path.exists():
+        logger.warning(f"DuckDB snapshot {db_path} not found, reading parquet files directly")
+        return None
+    # путь файла сборки, а не ссылки: по пути ссылки DuckDB вернул бы прежнюю, ещё открытую сборку
+    con = duckdb.connect(str(db_path.resolve()), read_only=True)
+    build = read_build(con)
+    if build is not None and build["manifest_sha256"] == digest:
+        return con
+    con.close()
+    logger.warning(f"DuckDB snapshot {db_path} was built for another manifest.json, reading parquet files directly")
+    return None
+
+
+def native_build_id(cfg: dict, storage_root: Path, digest: str) -> str:
+    """
+    build_id файла, по которому пойдут запросы, None - запросы идут к parquet
+    """
+    con = open_native(cfg, storage_root, digest)
+    if con is None:
+        return None
+    try:
+        return read_build(con)["build_id"]
+    finally:
+        con.close()
+
+
+def connect(cfg: dict, storage_root: Path, digest: str = None) -> duckdb.DuckDBPyConnection:
+    """
+    Подключение к снапшоту.
+    Если нативный файл собран по текущему manifest.json (digest, см. manifest_digest) -
+    открываем его только на чтение, иначе создаём представления с именами схем поверх parquet файлов
+    """
+    if digest is None:
+        digest = manifest_digest(cfg, storage_root)
+    con = open_native(cfg, storage_root, digest)
+    if con is not None:
+        logger.info(f"Connected to DuckDB snapshot build {read_build(con)['build_id']}")
+        return con
+
+    con = duckdb.connect()
+    for schema_name, schema_cfg in cfg["schemas"].items():
+        source = schema_source(storage_root, schema_cfg)
+        # без колонок sha256: поверх parquet хэш считался бы по каждой строке каждого запроса,
+        # lookup отдаёт blob содержимым (см. utils.sql_select_only)
+        con.execute(f"CREATE VIEW {schema_name} AS SELECT * FROM {source}")
+    return con
+
+
+def read_metadata(cfg: dict, storage_root: Path) -> dict:
+    """
+    Читает футеры parquet файлов всех схем (прогрев кэша ОС перед запросами).
+    Возвращает {схема: {"files", "row_groups", "rows"}}
+    """
+    con = duckdb.connect()
+    try:
+        result = {}
+        for schema_name, schema_cfg in cfg["schemas"].items():
+            files, row_groups, rows = con.execute(
+                "SELECT COUNT(DISTINCT file_name), COUNT(DISTINCT (file_name, row_group_id)), "
+                "COALESCE(SUM(row_group_num_rows) FILTER (WHERE column_id = 0), 0) "
+                "FROM parquet_metadata(?)", [schema_glob(storage_root, schema_cfg)]
+            ).fetchone()
+            result[schema_name] = {"files": files, "row_groups": row_groups, "rows": int(rows)}
+        return result
+    finally:
+        con.close()
+
+
+def read_mapping(cfg_path: Path) -> dict:
+    return yaml.safe_load(cfg_path.read_text(encoding="utf-8"))
+
+
+def snapshot_version(mapping_raw: bytes, manifest_sha256: str, build_id: str = None) -> str:
+    """
+    Версия снапшота: хэш содержимого mapping.yml, manifest.json и id сборки нативного файла,
+    по которому идут запросы (None - parquet). Пересборка snapshot_load меняет версию и ключи кэша
+    """
+    digest = hashlib.sha256(mapping_raw)
+    digest.update(f"\0{manifest_sha256}\0{build_id or ''}".encode())
+    return digest.hexdigest()[:16]
+
+
+def mtime(path: Path):
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class Snapshot:
+    """
+    Одна загруженная версия снапшота: mapping.yml, соединение DuckDB,
+    пул курсоров и компилятор запросов.
+    Запросы держат версию через acquire/release, выведенная из работы версия
+    закрывается, когда её отпустит последний запрос
+    """
+
+    def __init__(self, cfg_path: Path, pool_size: int, pool_timeout: float, query_cache_size: int,
+                 export_pool_size: int = 1):
+        self.cfg_path = cfg_path
+        # отпечаток каждого файла снимаем до его чтения: изменение во время загрузки
+        # даст другой отпечаток, и watcher загрузит версию ещё раз
+        cfg_mtime = mtime(cfg_path)
+        mapping_raw = cfg_path.read_bytes()
+        self.cfg = yaml.safe_load(mapping_raw)
+        self.storage_root = Path(self.cfg["storage"]["root"])
+        self.storage_root.mkdir(parents=True, exist_ok=True)
+        self.loaded_signature = (cfg_mtime, *self.signature()[1:])
+
+        digest = manifest_digest(self.cfg, self.storage_root)
+        self.con = connect(self.cfg, self.storage_root, digest)
+        build = read_build(self.con)
+        # версия для ключей кэша и статуса проверки
+        self.version = snapshot_version(mapping_raw, digest, build and build["build_id"])
+        self.pool = CursorPool(self.con, pool_size, pool_timeout)
+        # отдельные курсоры для /v1/export: поток выгрузки держит курсор, пока клиент читает ответ
+        self.export_pool = CursorPool(self.con, export_pool_size, pool_timeout)
+        partition_specs = {
+            schema_name: partitions.partition_spec(schema_cfg)
+            for schema_name, schema_cfg in self.cfg["schemas"].items()
+            if partitions.partition_spec(schema_cfg)
+        }
+        # где искать blob по sha256 для /v1/blob, пусто - снапшот поверх parquet, /v1/blob недоступен
+        # и lookup отдаёт blob содержимым вместо ссылок
+        self.blob_indexed = blobs.indexed_columns(self.con)
+        self.compiler = QueryCompiler(
+            self.cfg.get("groups", {}), query_cache_size, ngram.indexed_columns(self.con), partition_specs,
+            blob_refs=bool(self.blob_indexed)
+        )
+
+        self._refs = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def signature(self) -> tuple:
+        """
+        mtime файлов, от которых зависит версия: mapping.yml, manifest.json, файл DuckDB
+        """
+        return (
+            mtime(self.cfg_path),
+            mtime(manifest_path(self.cfg, self.storage_root)),
+            mtime(snapshot_db_path(self.cfg, self.storage_root)),
+        )
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            close = self._retired and self._refs == 0
+        if close:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            close = self._refs == 0
+        if close:
+            self._close()
+
+    def _close(self):
+        self.pool.close()
+        self.export_pool.close()
+        self.con.close()
+        logger.info(f"Snapshot {self.version} closed")
+
+
+class SnapshotRegistry:
+    """
+    Текущая версия снапшота воркера.
+    Фоновый поток следит за mapping.yml, manifest.json и файлом DuckDB,
+    при изменении загружает новую версию и атомарно подменяет текущую.
+    Запросы на старой версии дорабатывают на ней
+    """
+
+    def __init__(self, cfg_path: Path, pool_size: int, pool_timeout: float, query_cache_size: int, poll_interval: float,
+                 export_pool_size: int = 1):
+        self.cfg_path = cfg_path
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.query_cache_size = query_cache_size
+        self.poll_interval = poll_interval
+        self.export_pool_size = export_pool_size
+        self._current = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def _load(self) -> Snapshot:
+        snap = Snapshot(
+            self.cfg_path, self.pool_size, self.pool_timeout, self.query_cache_size, self.export_pool_size
+        )
+        logger.info(f"Snapshot {snap.version} loaded")
+        return snap
+
+    def current(self) -> Snapshot:
+        """
+        Текущая версия без удержания, для чтения конфигурации
+        """
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = self._load()
+                    self._start_watcher()
+        return self._current
+
+    def acquire(self) -> Snapshot:
+        """
+        Текущая версия, удерживаемая до snap.release()
+        """
+        self.current()
+        with self._lock:
+            return self._current.acquire()
+
+    @contextmanager
+    def using(self):
+        snap = self.acquire()
+        try:
+            yield snap
+        finally:
+            snap.release()
+
+    def reload(self):
+        """
+        Загружает новую версию и подменяет текущую, старая закроется после последнего запроса
+        """
+        snap = self._load()
+        with self._lock:
+            old, self._current = self._current, snap
+        if old is not None:
+            old.retire()
+
+    def _start_watcher(self):
+        if self.poll_interval and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name='snapshot-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            snap = self._current
+            signature = snap.signature()
+            if signature == snap.loaded_signature:
+                continue
+            logger.info(f"Snapshot files changed, reloading {snap.version}")
+            try:
+                self.reload()
+            except Exception as e:
+                # остаёмся на старой версии до следующего изменения файлов
+                snap.loaded_signature = signature
+                logger.exception(f"Snapshot reload failed: {e}")
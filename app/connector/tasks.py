@@ -0,0 +1,93 @@
+import datetime
+import logging
+import time
+from pathlib import Path
+
+import yaml
+from celery import shared_task
+from django.utils import timezone
+
+from . import snapshot
+from .config import (
+    CFG_PATH, CONNECTOR_HASH_CHUNK_SIZE, CONNECTOR_HASH_WORKERS, CONNECTOR_VERIFY_REDIS_URL, CONNECTOR_VERIFY_TTL,
+    CONNECTOR_VERIFY_LEASE_TTL, CONNECTOR_PROFILE_RETENTION_DAYS,
+)
+from .integrity import (
+    HashVerifier, VerificationStore, VERIFY_DONE, VERIFY_ERROR, VERIFY_FAILED, VERIFY_OK, VERIFY_RUNNING,
+)
+from .models import QueryProfile
+
+
+logger = logging.getLogger(__name__)
+
+# хэши, посчитанные воркером Celery, повторные проверки неизменённых файлов их не перечитывают
+VERIFIER = HashVerifier(CONNECTOR_HASH_CHUNK_SIZE, CONNECTOR_HASH_WORKERS)
+STORE = VerificationStore(CONNECTOR_VERIFY_REDIS_URL, CONNECTOR_VERIFY_TTL)
+
+
+@shared_task(ignore_result=True)
+def verify_snapshot(version=None, force=False):
+    """
+    Проверяет текущую версию снапшота: хэши файлов по manifest.json и чтение футеров parquet.
+    Статус публикуется в Redis по версии снапшота, /v1/check-hash только читает его.
+    version - версия, которую заявил /v1/check-hash (None - версия файлов на диске, задача beat).
+    Если файлы на диске уже другой версии, заявленная не проверяется: её статус - error.
+    Уже проверенная версия повторно не проверяется без force.
+    Версию проверяет один воркер: задача без захвата в Redis завершается, захват упавшего воркера истекает
+    """
+    mapping_raw = CFG_PATH.read_bytes()
+    cfg = yaml.safe_load(mapping_raw)
+    storage_root = Path(cfg["storage"]["root"])
+    digest = snapshot.manifest_digest(cfg, storage_root)
+    disk_version = snapshot.snapshot_version(mapping_raw, digest, snapshot.native_build_id(cfg, storage_root, digest))
+    version = version or disk_version
+
+    with STORE.lease(version, CONNECTOR_VERIFY_LEASE_TTL) as acquired:
+        if not acquired:
+            logger.info(f"Snapshot {version} verification is already running")
+            return
+        # статус перечитывается под захватом: предыдущий владелец мог закончить проверку
+        status = STORE.get(version)
+        if not force and status and status["status"] in VERIFY_DONE:
+            return
+
+        started = time.time()
+        if version != disk_version:
+            # файлы сменились после запроса: хэши диска к заявленной версии не относятся
+            STORE.publish(version, {
+                "version": version, "status": VERIFY_ERROR, "started_at": started, "duration_ms": 0,
+                "detail": f"Версия снапшота на диске {disk_version}, а не {version}: проверьте новую версию",
+            })
+            logger.warning(f"Snapshot {version} verification rejected: files on disk are version {disk_version}")
+            return
+
+        STORE.publish(version, {"version": version, "status": VERIFY_RUNNING, "started_at": started})
+        status = {"version": version, "started_at": started}
+        try:
+            manifest_file = snapshot.manifest_path(cfg, storage_root)
+            if not manifest_file.exists():
+                raise FileNotFoundError(f"{manifest_file} не найден")
+            report = VERIFIER.verify(
+                cfg, storage_root, manifest_file, snapshot.derived_manifest_path(cfg, storage_root)
+            )
+            status.update(status=VERIFY_OK if report["ok"] else VERIFY_FAILED, schemas=report["schemas"])
+            if report["ok"]:
+                status["metadata"] = snapshot.read_metadata(cfg, storage_root)
+        except Exception as e:
+            logger.exception(f"Snapshot {version} verification failed: {e}")
+            status.update(status=VERIFY_ERROR, detail=str(e))
+
+        status["duration_ms"] = int((time.time() - started) * 1000)
+        STORE.publish(version, status)
+    logger.info(f"Snapshot {version} verification: {status['status']}, {status['duration_ms']} ms")
+
+
+@shared_task(ignore_result=True)
+def query_profile_retention(days=CONNECTOR_PROFILE_RETENTION_DAYS):
+    """
+    Удаляет профили медленных запросов старше days дней
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    deleted, _ = QueryProfile.objects.filter(create_datetime__lt=cutoff).delete()
+    logger.info(f"QueryProfile retention: {deleted} deleted before {cutoff:%Y-%m-%d %H:%M}")
+    return deleted
@@ -1,3 +1,883 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import duckdb
+import jwt
+import pyarrow as pa
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from ninja_jwt.exceptions import AuthenticationFailed
+from ninja_jwt.tokens import AccessToken
+from prometheus_client import REGISTRY
+
+from . import blobs, metrics, ngram, partitions, snapshot, views
+from .auth import CachedJWTAuth, USER_CACHE, UserCache
+from .cache import LookupCache
+from .export import arrow_chunks, ndjson_chunks
+from .integrity import HashVerifier, file_sha256
+from .models import QueryProfile
+from .paging import fetch_page, TOTAL_ESTIMATE, TOTAL_NONE
+from .pool import CursorPool, PoolTimeout
+from .profiling import SlowQueryProfiler, redact_params
+from .serialize import Fragment, dumps, table_to_json
+from .signing import ResponseSigner, SIGN_DETACHED, SIGNATURE_HEADER
+from .timing import StageTimer, server_timing
+from .utils import QueryCompiler
+
+
+class CursorPoolTest(TestCase):
+    def test_timeout(self):
+        pool = CursorPool(duckdb.connect(), size=1, timeout=0.01)
+        with pool.cursor() as con:
+            self.assertEqual(con.execute("SELECT 1").fetchone()[0], 1)
+            with self.assertRaises(PoolTimeout):
+                with pool.cursor():
+                    pass
+
+        stats = pool.stats()
+        self.assertEqual(stats["available"], 1)
+        self.assertEqual(stats["checkouts"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+
+
+class FetchPageTest(TestCase):
+    sql = "SELECT i FROM range(10) t(i)"
+
+    def setUp(self):
+        self.con = duckdb.connect()
+
+    def test_exact(self):
+        table, total, has_next = fetch_page(self.con, self.sql, {}, 4, 4)
+        self.assertEqual(table.column_names, ["i"])
+        self.assertEqual((table.num_rows, total, has_next), (4, 10, True))
+
+        table, total, has_next = fetch_page(self.con, self.sql, {}, 4, 8)
+        self.assertEqual((table.num_rows, total, has_next), (2, 10, False))
+
+        table, total, has_next = fetch_page(self.con, self.sql, {}, 4, 20)
+        self.assertEqual((table.num_rows, total, has_next), (0, 10, False))
+
+    def test_none(self):
+        table, total, has_next = fetch_page(self.con, self.sql, {}, 4, 0, TOTAL_NONE)
+        self.assertEqual((table.num_rows, total, has_next), (4, None, True))
+
+        table, total, has_next = fetch_page(self.con, self.sql, {}, 5, 5, TOTAL_NONE)
+        self.assertEqual((table.num_rows, total, has_next), (5, 10, False))
+
+    def test_estimate(self):
+        table, total, has_next = fetch_page(self.con, self.sql, {}, 4, 0, TOTAL_ESTIMATE)
+        self.assertEqual((table.num_rows, has_next), (4, True))
+        self.assertIsInstance(total, int)
+
+    def test_timer(self):
+        timer = StageTimer()
+        fetch_page(self.con, self.sql, {}, 4, 20, timer=timer)
+        self.assertEqual(set(timer.stages), {"page", "count"})
+        timer.add("page", 1)
+        self.assertIn("page;dur=", server_timing(timer.stages))
+
+
+class MetricsTest(TestCase):
+    def test_track(self):
+        sample = lambda status: REGISTRY.get_sample_value(
+            "connector_requests_total", {"endpoint": "test", "status": status}
+        ) or 0
+        view = metrics.track("test")(lambda request, found: (200, {}) if found else (404, {}))
+        view(None, True)
+        view(None, False)
+        view(None, False)
+        self.assertEqual((sample("200"), sample("404")), (1, 2))
+        self.assertIn(b"connector_requests_total", metrics.render()[0])
+
+    def test_group_label(self):
+        groups = {"persons_general": {}}
+        self.assertEqual(metrics.group_label(groups, "persons_general"), "persons_general")
+        self.assertEqual(metrics.group_label(groups, "x" * 100), metrics.UNKNOWN_GROUP)
+
+    def test_allowed(self):
+        factory = RequestFactory()
+        networks = ("127.0.0.0/8", "10.0.0.0/8")
+        self.assertTrue(metrics.allowed(factory.get("/metrics", REMOTE_ADDR="10.1.2.3"), None, networks))
+        self.assertFalse(metrics.allowed(factory.get("/metrics", REMOTE_ADDR="203.0.113.5"), None, networks))
+        self.assertFalse(metrics.allowed(factory.get("/metrics", REMOTE_ADDR="10.1.2.3"), "secret", networks))
+        self.assertTrue(metrics.allowed(
+            factory.get("/metrics", REMOTE_ADDR="203.0.113.5", HTTP_AUTHORIZATION="Bearer secret"), "secret", networks
+        ))
+
+
+class SlowQueryProfilerTest(TestCase):
+    def test_redacts_params(self):
+        self.assertEqual(
+            redact_params({"p0": "ОСМОНАЛИЕВ", "g1": ["ОСМ", "СМО"], "p2": 7}),
+            {"p0": "str(10)", "g1": "list(2)", "p2": "int"}
+        )
+
+    def test_remembers_bounded_keys(self):
+        snap = mock.Mock(version="v1")
+        executor = mock.Mock()
+        profiler = SlowQueryProfiler(threshold_ms=10, interval=300, executor=executor)
+        profiler.max_keys = 3
+        with self.assertLogs("connector.profiling", "WARNING") as logs:
+            for i in range(5):
+                profiler.maybe_capture(snap, "g", f"SELECT {i}", {}, 50)
+            profiler.maybe_capture(snap, "g", "SELECT 4", {}, 50)
+        self.assertEqual(executor.submit.call_count, 5)
+        # повтор в пределах interval не профилируется и в лог не пишется
+        self.assertEqual(len(logs.records), 5)
+        self.assertEqual(len(profiler._last), 3)
+
+    def test_retention(self):
+        from .tasks import query_profile_retention
+
+        old = QueryProfile.objects.create(group_name="g", snapshot_version="v", duration_ms=1, sql="", plan="")
+        QueryProfile.objects.filter(pk=old.pk).update(create_datetime=timezone.now() - datetime.timedelta(days=30))
+        QueryProfile.objects.create(group_name="g", snapshot_version="v", duration_ms=1, sql="", plan="")
+        self.assertEqual(query_profile_retention(14), 1)
+        self.assertEqual(QueryProfile.objects.count(), 1)
+
+
+class SerializeTest(TestCase):
+    def test_table_to_json(self):
+        con = duckdb.connect()
+        table = con.execute(
+            "SELECT i, 'Ы' || i AS name, DATE '2000-01-01' + i::INT AS birth_date, [i] AS ids FROM range(2) t(i)"
+        ).fetch_arrow_table()
+        rows = table_to_json(con, table)
+        self.assertEqual(json.loads(rows), [
+            {"i": 0, "name": "Ы0", "birth_date": "2000-01-01", "ids": [0]},
+            {"i": 1, "name": "Ы1", "birth_date": "2000-01-02", "ids": [1]},
+        ])
+        self.assertEqual(table_to_json(con, table.slice(0, 0)), b"[]")
+        self.assertEqual(json.loads(dumps({"results": Fragment(rows)}))["results"][1]["i"], 1)
+
+    def test_decimal_and_timestamp(self):
+        con = duckdb.connect()
+        table = con.execute(
+            "SELECT DATE '2020-01-02' AS d, TIMESTAMP '2020-01-02 03:04:05' AS ts, 12.50::DECIMAL(10, 2) AS amount, "
+            "[{'paid': 1.5::DECIMAL(4, 2), 'at': TIMESTAMP '2020-01-02 03:04:05.5'}] AS payments, "
+            "NULL::DECIMAL(4, 2) AS empty"
+        ).fetch_arrow_table()
+        row = {"d": "2020-01-02", "ts": "2020-01-02T03:04:05", "amount": "12.50",
+               "payments": [{"paid": "1.50", "at": "2020-01-02T03:04:05.5"}], "empty": None}
+        self.assertEqual(json.loads(table_to_json(con, table)), [row])
+        # python значения кодируются так же
+        python_row = table.to_pylist()[0]
+        self.assertEqual(
+            {key: json.loads(dumps(python_row[key])) for key in ("d", "ts", "amount")},
+            {key: row[key] for key in ("d", "ts", "amount")}
+        )
+
+
+class ExportTest(TestCase):
+    sql = "SELECT i, 'Ы' || i AS name FROM range($n) t(i)"
+
+    def test_ndjson(self):
+        chunks = list(ndjson_chunks(duckdb.connect(), self.sql, {"n": 5}, batch_rows=2))
+        rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+        self.assertEqual(rows[4], {"i": 4, "name": "Ы4"})
+        self.assertEqual(len(rows), 5)
+
+    def test_arrow(self):
+        data = b"".join(arrow_chunks(duckdb.connect(), self.sql, {"n": 5}, batch_rows=2))
+        self.assertEqual(pa.ipc.open_stream(data).read_all().column("i").to_pylist(), [0, 1, 2, 3, 4])
+
+        data = b"".join(arrow_chunks(duckdb.connect(), self.sql, {"n": 0}, batch_rows=2))
+        self.assertEqual(pa.ipc.open_stream(data).read_all().num_rows, 0)
+
+
+class QueryCompilerTest(TestCase):
+    groups = {
+        "persons": {
+            "from": {
+                "schema": "persons",
+                "select": {"lastname": "persons.lastname", "phones": "phone.phones"},
+                "join": [{"schema": "phone", "on": "persons.person_id = phone.person_id"}],
+                "where_any": {
+                    "lastname": "persons.lastname",
+                    "birth_date": "persons.birth_date",
+                    "passport": {"path": "persons.passport", "match": "exact"},
+                    "inn": {"path": "persons.inn", "match": "prefix"},
+                    "phone.phones": "phone.phones",
+                },
+            }
+        }
+    }
+
+    def test_compile(self):
+        compiler = QueryCompiler(self.groups, maxsize=8)
+        subject = {"lastname": "O'BRIEN", "phone.phones": "996"}
+        query = compiler.compile("persons", subject)
+
+        self.assertNotIn("O'BRIEN", query.sql)
+        self.assertIn("phones = $p1", query.sql)
+        self.assertIn("lastname LIKE $p0", query.sql)
+        self.assertEqual(query.params(subject), {"p0": "%O'BRIEN%", "p1": "996"})
+
+        self.assertIs(compiler.compile("persons", {"lastname": "X", "phone.phones": "1"}), query)
+        self.assertIsNot(compiler.compile("persons", {"lastname": "X", "birth_date": "2000-01"}), query)
+        self.assertEqual(compiler.stats()["hits"], 1)
+
+    def test_match_modes(self):
+        compiler = QueryCompiler(self.groups, maxsize=8)
+        subject = {"passport": "AN123", "inn": "2010"}
+        query = compiler.compile("persons", subject)
+
+        self.assertIn("passport = $p0", query.sql)
+        self.assertIn("inn LIKE $p1", query.sql)
+        self.assertEqual(query.params(subject), {"p0": "AN123", "p1": "2010%"})
+
+    def test_partition_buckets(self):
+        con = duckdb.connect()
+        con.execute("CREATE TABLE persons AS SELECT i AS person_id, 'N' || i AS lastname, 'P' || i AS passport FROM range(100) t(i)")
+        con.execute(f"CREATE TABLE phone AS SELECT i % 100 AS person_id, '996' || i AS phones, "
+                    f"{partitions.bucket_sql('i % 100', 4)} AS person_id__bucket FROM range(300) t(i)")
+
+        compiler = QueryCompiler(self.groups, maxsize=8, partition_specs={"phone": ("person_id", 4)})
+        subject = {"passport": "P7"}
+        query = compiler.compile("persons", subject)
+        self.assertIn("person_id__bucket IN (SELECT CAST(md5_number(CAST(persons.person_id AS VARCHAR))", query.sql)
+
+        rows = con.execute(query.sql, query.params(subject)).fetchall()
+        self.assertEqual(sorted(p["phones"] for p in rows[0][1]), ["996107", "996207", "9967"])
+
+    def test_join_page(self):
+        con = duckdb.connect()
+        con.execute("CREATE TABLE persons AS SELECT i AS person_id, 'N' || i AS lastname FROM range(100) t(i)")
+        con.execute("CREATE TABLE phone AS SELECT i % 100 AS person_id, '996' || i AS phones FROM range(300) t(i)")
+
+        query = QueryCompiler(self.groups, maxsize=8).compile("persons", {"lastname": "N1"})
+        self.assertIn("person_id IN (SELECT persons.person_id FROM __main AS persons)", query.sql)
+
+        params = query.params({"lastname": "N1"})
+        table, total, has_next = fetch_page(con, query, params, 4, 8)
+        self.assertEqual((table.num_rows, total, has_next), (3, 11, False))
+        self.assertEqual(table.column_names, ["lastname", "phone"])
+        self.assertTrue(all(len(phones) == 3 for phones in table.column("phone").to_pylist()))
+        self.assertEqual(con.execute(f"SELECT COUNT(*) FROM ({query.sql})", params).fetchone()[0], 11)
+
+
+class NgramIndexTest(TestCase):
+    def test_probe(self):
+        con = duckdb.connect()
+        con.execute("CREATE TABLE persons AS SELECT * FROM (VALUES ('ОСМОНАЛИЕВ'), ('ОСМОНОВ'), ('ИВАНОВ'), ('ОС'), (NULL)) t(lastname)")
+        ngram.build_index(con, "persons", "lastname")
+        self.assertEqual(ngram.indexed_columns(con), {("persons", "lastname")})
+
+        sql = f"SELECT lastname FROM persons WHERE {ngram.probe_condition('persons', 'lastname', '$g')} ORDER BY lastname"
+        rows = con.execute(sql, {"g": ngram.ngrams("ОСМОН")}).fetchall()
+        self.assertEqual(rows, [("ОСМОНАЛИЕВ",), ("ОСМОНОВ",)])
+
+
+class BlobsTest(TestCase):
+    def test_find_by_hash(self):
+        con = duckdb.connect()
+        source = "(SELECT i AS person_id, ('img' || i)::BLOB AS photo FROM range(100) t(i))"
+        con.execute(f"CREATE TABLE document_images AS SELECT *{blobs.ref_columns_sql(blobs.blob_columns(con, source))} FROM {source}")
+        blobs.build_index(con, "document_images", "photo")
+
+        indexed = blobs.indexed_columns(con)
+        self.assertEqual(indexed, {("document_images", "photo")})
+        self.assertEqual(blobs.find(con, indexed, hashlib.sha256(b"img42").hexdigest()), b"img42")
+        self.assertIsNone(blobs.find(con, indexed, "0" * 64))
+
+    def test_parse_range(self):
+        self.assertEqual(blobs.parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(blobs.parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(blobs.parse_range("bytes=-10", 100), (90, 99))
+        self.assertIsNone(blobs.parse_range("", 100))
+        self.assertIsNone(blobs.parse_range("bytes=0-1,5-6", 100))
+        with self.assertRaises(ValueError):
+            blobs.parse_range("bytes=100-", 100)
+
+
+class LookupCacheTest(TestCase):
+    def test_byte_budget_and_version(self):
+        cache = LookupCache(max_bytes=10)
+        cache.set_version("v1")
+        cache.set("a", b"12345")
+        cache.set("b", b"12345")
+        self.assertEqual(cache.get("a"), b"12345")
+        cache.set("c", b"12345")   # вытесняет b, a использовался недавно
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), b"12345")
+
+        cache.set_version("v2")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["local_hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_key_is_normalized(self):
+        self.assertEqual(
+            LookupCache.make_key("v1", "g", {"a": "1", "b": "2"}, {"limit": 10, "offset": 0}),
+            LookupCache.make_key("v1", "g", {"b": "2", "a": "1"}, {"offset": 0, "limit": 10}),
+        )
+
+
+class LoadSnapshotTest(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.write_persons(1000)
+        self.cfg = {
+            "storage": {"root": str(self.root)},
+            "schemas": {"persons": {"path": "persons.parquet", "sort_by": ["id"]}},
+        }
+
+    def write_persons(self, rows):
+        duckdb.sql(
+            f"COPY (SELECT (i * 7919) % {rows} AS id FROM range({rows}) t(i)) TO '{self.root}/persons.parquet' (FORMAT parquet)"
+        )
+        (self.root / "manifest.json").write_text(json.dumps({"rows": rows}))
+
+    def connect(self):
+        con = snapshot.connect(self.cfg, self.root)
+        self.addCleanup(con.close)
+        return con
+
+    def test_sorted_by_keys(self):
+        db_path = snapshot.load_snapshot(self.cfg, self.root)
+        self.assertEqual(snapshot.build_files(db_path), [db_path.resolve()])
+
+        con = self.connect()
+        ids = [row[0] for row in con.execute("SELECT id FROM persons ORDER BY rowid").fetchall()]
+        self.assertEqual(ids, list(range(1000)))
+        self.assertEqual(snapshot.read_build(con)["manifest_sha256"], snapshot.manifest_digest(self.cfg, self.root))
+
+    def test_failed_load_keeps_previous_file(self):
+        snapshot.load_snapshot(self.cfg, self.root)
+        broken = {**self.cfg, "schemas": {**self.cfg["schemas"], "missing": {"path": "missing.parquet"}}}
+        with self.assertRaises(duckdb.IOException):
+            snapshot.load_snapshot(broken, self.root)
+
+        con = self.connect()
+        self.assertIsNotNone(snapshot.read_build(con))
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM persons").fetchone()[0], 1000)
+        self.assertEqual(len(snapshot.build_files(snapshot.snapshot_db_path(self.cfg, self.root))), 1)
+
+    def test_keeps_previous_build(self):
+        db_path = snapshot.load_snapshot(self.cfg, self.root)
+        first = db_path.resolve()
+        for _ in range(3):
+            snapshot.load_snapshot(self.cfg, self.root)
+        self.assertNotEqual(db_path.resolve(), first)
+        self.assertEqual(len(snapshot.build_files(db_path)), 2)
+
+    def test_stale_file_is_not_used(self):
+        snapshot.load_snapshot(self.cfg, self.root)
+        # опубликованы новые parquet и manifest.json, snapshot_load ещё не запускали
+        self.write_persons(5)
+
+        con = self.connect()
+        self.assertIsNone(snapshot.read_build(con))
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM persons").fetchone()[0], 5)
+
+
+class SnapshotRegistryTest(TestCase):
+    def test_reload_keeps_old_version_until_release(self):
+        root = Path(tempfile.mkdtemp())
+        duckdb.sql(f"COPY (SELECT 1 AS id) TO '{root}/persons.parquet' (FORMAT parquet)")
+        cfg_path = root / "mapping.yml"
+        cfg_path.write_text(f"storage:\n  root: {root}\nschemas:\n  persons:\n    path: persons.parquet\ngroups: {{}}\n")
+
+        registry = snapshot.SnapshotRegistry(cfg_path, 2, 1, 8, poll_interval=0)
+        old = registry.acquire()
+        registry.reload()
+        self.assertIsNot(registry.current(), old)
+
+        with old.pool.cursor() as con:
+            self.assertEqual(con.execute("SELECT COUNT(*) FROM persons").fetchone()[0], 1)
+        old.release()
+        with self.assertRaises(duckdb.ConnectionException):
+            old.con.execute("SELECT 1")
+
+    def test_change_during_load_is_noticed(self):
+        root = Path(tempfile.mkdtemp())
+        duckdb.sql(f"COPY (SELECT 1 AS id) TO '{root}/persons.parquet' (FORMAT parquet)")
+        cfg_path = root / "mapping.yml"
+        cfg_path.write_text(f"storage:\n  root: {root}\nschemas:\n  persons:\n    path: persons.parquet\n")
+        read_bytes = Path.read_bytes
+
+        def read_then_change(path):
+            raw = read_bytes(path)
+            if path == cfg_path:
+                # mapping.yml меняется сразу после чтения
+                os.utime(cfg_path, ns=(0, cfg_path.stat().st_mtime_ns + 1))
+            return raw
+
+        with mock.patch.object(Path, "read_bytes", read_then_change):
+            snap = snapshot.Snapshot(cfg_path, 1, 1, 8)
+        self.assertNotEqual(snap.signature(), snap.loaded_signature)
+        snap.retire()
+
+    def test_rebuild_changes_version(self):
+        root = Path(tempfile.mkdtemp())
+        cfg_path = root / "mapping.yml"
+        cfg_path.write_text(f"storage:\n  root: {root}\nschemas:\n  persons:\n    path: persons.parquet\ngroups: {{}}\n")
+        cfg = snapshot.read_mapping(cfg_path)
+
+        def publish(rows):
+            duckdb.sql(f"COPY (SELECT range AS id FROM range({rows})) TO '{root}/persons.parquet' (FORMAT parquet)")
+            (root / "manifest.json").write_text(json.dumps({"rows": rows}))
+
+        def count(snap):
+            with snap.pool.cursor() as con:
+                return con.execute("SELECT COUNT(*) FROM persons").fetchone()[0]
+
+        publish(1)
+        snapshot.load_snapshot(cfg, root)
+        registry = snapshot.SnapshotRegistry(cfg_path, 2, 1, 8, poll_interval=0)
+        versions = [registry.current().version]
+        old = registry.acquire()
+
+        # новые parquet и manifest.json до snapshot_load: старый файл не используется
+        publish(2)
+        registry.reload()
+        versions.append(registry.current().version)
+        self.assertEqual(count(registry.current()), 2)
+
+        # snapshot_load при открытой старой сборке: новая версия читает новый файл
+        publish(3)
+        registry.reload()
+        snapshot.load_snapshot(cfg, root)
+        registry.reload()
+        versions.append(registry.current().version)
+        self.assertEqual(count(registry.current()), 3)
+        self.assertEqual(count(old), 1)
+        self.assertEqual(len(set(versions)), 3)
+        old.release()
+
+
+class HashVerifierTest(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        (self.root / "images").mkdir()
+        (self.root / "persons.parquet").write_bytes(b"p" * 1000)
+        (self.root / "images" / "part-0.parquet").write_bytes(b"i" * 10)
+        self.cfg = {"schemas": {"persons": {"path": "persons.parquet"}, "images": {"path": "images"}}}
+        self.manifest = self.root / "manifest.json"
+        self.manifest.write_text(json.dumps({"hashes": {
+            "persons.parquet": "sha256:" + hashlib.sha256(b"p" * 1000).hexdigest(),
+            "images/part-0.parquet": "sha256:" + hashlib.sha256(b"i" * 10).hexdigest(),
+        }}))
+
+    def test_chunked_hash(self):
+        self.assertEqual(file_sha256(self.root / "persons.parquet", 64), hashlib.sha256(b"p" * 1000).hexdigest())
+
+    def test_verify_all_schemas(self):
+        verifier = HashVerifier(chunk_size=64, workers=2)
+        report = verifier.verify(self.cfg, self.root, self.manifest)
+        self.assertTrue(report["ok"])
+        self.assertEqual(report["schemas"]["images"], [{"file": "images/part-0.parquet", "status": "ok"}])
+        self.assertEqual(verifier.stats()["known_files"], 2)
+
+        (self.root / "persons.parquet").write_bytes(b"x" * 1000)
+        report = verifier.verify(self.cfg, self.root, self.manifest)
+        self.assertFalse(report["ok"])
+        self.assertEqual(report["schemas"]["persons"][0]["status"], "mismatch")
+        self.assertEqual(report["schemas"]["images"][0]["status"], "ok")
+
+    def test_derived_dataset(self):
+        (self.root / "images_hive").mkdir()
+        (self.root / "images_hive" / "part-0.parquet").write_bytes(b"h" * 10)
+        derived = self.root / "manifest.derived.json"
+        derived.write_text(json.dumps({"datasets": {"images_hive": {
+            "source": {"images/part-0.parquet": "sha256:" + hashlib.sha256(b"i" * 10).hexdigest()},
+            "hashes": {"images_hive/part-0.parquet": "sha256:" + hashlib.sha256(b"h" * 10).hexdigest()},
+        }}}))
+        self.cfg["schemas"]["images"] = {"path": "images_hive"}
+        verifier = HashVerifier(chunk_size=64, workers=2)
+        self.assertTrue(verifier.verify(self.cfg, self.root, self.manifest, derived)["ok"])
+        self.assertFalse(verifier.verify(self.cfg, self.root, self.manifest)["ok"])
+
+        # издатель опубликовал другие исходные файлы: собранный из старых датасет не подтверждён
+        manifest = json.loads(self.manifest.read_text())
+        manifest["hashes"]["images/part-0.parquet"] = "sha256:" + hashlib.sha256(b"j" * 10).hexdigest()
+        self.manifest.write_text(json.dumps(manifest))
+        report = verifier.verify(self.cfg, self.root, self.manifest, derived)
+        self.assertEqual(report["schemas"]["images"], [{"file": "images_hive/part-0.parquet", "status": "stale"}])
+
+
+class MemoryStore:
+    def __init__(self):
+        self.statuses = {}
+        self.leases = set()
+
+    def get(self, version):
+        return self.statuses.get(version)
+
+    def publish(self, version, status):
+        self.statuses[version] = status
+
+    def claim(self, version):
+        return self.statuses.setdefault(version, {"version": version, "status": "pending"})["status"] == "pending"
+
+    def forget(self, version):
+        self.statuses.pop(version, None)
+
+    def running(self, version):
+        return version in self.leases
+
+    @contextmanager
+    def lease(self, version, ttl):
+        if version in self.leases:
+            yield False
+            return
+        self.leases.add(version)
+        try:
+            yield True
+        finally:
+            self.leases.discard(version)
+
+
+class VerifySnapshotTaskTest(TestCase):
+    def setUp(self):
+        root = Path(tempfile.mkdtemp())
+        duckdb.sql(f"COPY (SELECT range AS id FROM range(5)) TO '{root}/persons.parquet' (FORMAT parquet)")
+        digest = hashlib.sha256((root / "persons.parquet").read_bytes()).hexdigest()
+        (root / "manifest.json").write_text(json.dumps({"hashes": {"persons.parquet": f"sha256:{digest}"}}))
+        self.cfg_path = root / "mapping.yml"
+        self.cfg_path.write_text(f"storage:\n  root: {root}\nschemas:\n  persons:\n    path: persons.parquet\n")
+        self.store = MemoryStore()
+
+    def verify(self, version=None):
+        from . import tasks
+
+        with mock.patch.object(tasks, "CFG_PATH", self.cfg_path), mock.patch.object(tasks, "STORE", self.store):
+            tasks.verify_snapshot(version)
+
+    def test_publishes_status(self):
+        self.verify()
+        (status,) = self.store.statuses.values()
+        self.assertEqual(status["status"], "ok")
+        self.assertEqual(status["metadata"]["persons"]["rows"], 5)
+        self.assertFalse(self.store.leases)
+
+    def test_rejects_stale_version(self):
+        self.verify("0" * 16)
+        status = self.store.statuses["0" * 16]
+        self.assertEqual(status["status"], "error")
+        # проверена только заявленная версия, файлы диска другой версии не публикуются
+        self.assertEqual(list(self.store.statuses), ["0" * 16])
+
+        self.verify()
+        (version,) = set(self.store.statuses) - {"0" * 16}
+        self.verify(version)
+        self.assertEqual(self.store.statuses[version]["status"], "ok")
+
+    def test_skips_claimed_version(self):
+        with mock.patch.object(self.store, "lease") as lease:
+            lease.return_value.__enter__.return_value = False
+            self.verify()
+        self.assertEqual(self.store.statuses, {})
+
+
+@mock.patch.object(USER_CACHE, "redis_url", None)
+class CachedJWTAuthTest(TestCase):
+    def test_cache(self):
+        cache = UserCache(ttl=60, maxsize=2)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.set(3, "c")
+        self.assertEqual((cache.get(1), cache.get(3)), (None, "c"))
+        cache.invalidate(3)
+        self.assertIsNone(cache.get(3))
+
+    def test_invalidation(self):
+        user = get_user_model().objects.create_user("cached", "p")
+        auth = CachedJWTAuth()
+        token = auth.get_validated_token(str(AccessToken.for_user(user)))
+        auth.get_user(token)
+        with self.assertNumQueries(0):
+            self.assertEqual(auth.get_user(token), user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_active = False
+            user.save()
+            # до коммита кэш не сбрасывается: иначе параллельный запрос перечитал бы старые данные
+            with self.assertNumQueries(0):
+                auth.get_user(token)
+        with self.assertRaises(AuthenticationFailed):
+            auth.get_user(token)
+
+
+class ResponseSignerTest(TestCase):
+    body = b'{"data":{"persons_general":{"results":[]}}}'
+
+    def write_key(self, key):
+        (self.root / "private.pem").write_bytes(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+
+    def test_embedded_reloads_changed_key(self):
+        signer = ResponseSigner(str(self.root))
+        self.assertEqual(signer.sign(self.body), (self.body, {}))
+
+        key = ec.generate_private_key(ec.SECP256R1())
+        self.write_key(key)
+        out, headers = signer.sign(self.body)
+        token = json.loads(out)["jwt"]
+        self.assertEqual(jwt.api_jws.decode(token, key.public_key(), algorithms=["ES256"]), self.body)
+
+        self.write_key(ed25519.Ed25519PrivateKey.generate())
+        signer.sign(self.body)
+        self.assertEqual(signer.key()[1], "EdDSA")
+
+    def test_detached(self):
+        key = ed25519.Ed25519PrivateKey.generate()
+        self.write_key(key)
+        out, headers = ResponseSigner(str(self.root), SIGN_DETACHED).sign(self.body)
+        self.assertIs(out, self.body)
+        digest = hashlib.sha256(self.body).hexdigest().encode()
+        jwt.api_jws.decode(headers[SIGNATURE_HEADER], key.public_key(), algorithms=["EdDSA"], detached_payload=digest)
+
+
+class ApiTestCase(TestCase):
+    """
+    Снапшот во временной папке вместо views.REGISTRY, кэш результатов без Redis,
+    ответы без подписи (ключа в папке нет) и токен пользователя
+    """
+    groups = {
+        "persons": {
+            "from": {
+                "schema": "persons",
+                "select": {"lastname": "persons.lastname", "phones": "phone.phones"},
+                "join": [{"schema": "phone", "on": "persons.person_id = phone.person_id"}],
+                "where_any": {"lastname": {"path": "persons.lastname", "match": "prefix"}},
+            }
+        },
+        "phones": {
+            "from": {
+                "schema": "phone",
+                "select": {"phones": "phone.phones"},
+                "where_any": {"phones": "phone.phones"},
+            }
+        },
+    }
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        duckdb.sql(f"COPY (SELECT range AS person_id, 'N' || range AS lastname FROM range(100)) "
+                   f"TO '{self.root}/persons.parquet' (FORMAT parquet)")
+        duckdb.sql(f"COPY (SELECT range % 100 AS person_id, '996' || range AS phones FROM range(300)) "
+                   f"TO '{self.root}/phone.parquet' (FORMAT parquet)")
+        self.cfg_path = self.root / "mapping.yml"
+        self.cfg_path.write_text(json.dumps({
+            "storage": {"root": str(self.root)},
+            "schemas": {"persons": {"path": "persons.parquet"}, "phone": {"path": "phone.parquet"}},
+            "groups": self.groups,
+        }))
+        self.registry = snapshot.SnapshotRegistry(self.cfg_path, 2, 0.2, 8, poll_interval=0)
+        self.addCleanup(lambda: self.registry.current().retire())
+
+        for target, attribute, value in [
+            (views, "REGISTRY", self.registry), (views, "CACHE", LookupCache(1024 * 1024)),
+            (views, "SIGNER", ResponseSigner(str(self.root))), (USER_CACHE, "redis_url", None),
+        ]:
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        user = get_user_model().objects.create_user("api", "p")
+        self.auth = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    async def post(self, path, payload, **headers):
+        return await self.async_client.post(
+            f"/api/conn/{path}", payload, content_type="application/json", headers={**self.auth, **headers}
+        )
+
+
+class CheckHashViewTest(ApiTestCase):
+    def test_task_gets_claimed_version(self):
+        store = MemoryStore()
+        with mock.patch.object(views, "VERIFY_STORE", store), mock.patch.object(views.current_app, "send_task") as send_task:
+            response = self.client.get("/api/conn/v1/check-hash", headers=self.auth)
+        version = self.registry.current().version
+        self.assertEqual((response.status_code, response.json()["version"]), (202, version))
+        send_task.assert_called_once_with("connector.tasks.verify_snapshot", args=[version], retry=False)
+
+
+class ExportViewTest(ApiTestCase):
+    async def test_stream_keeps_lookup_pool_free(self):
+        response = await self.post("v1/export", {"group": "phones", "subject": {"phones": "9961"}})
+        self.assertEqual(response.status_code, 200)
+        snap = self.registry.current()
+        chunks = response.streaming_content
+        first = await anext(chunks)
+        self.assertEqual((snap.export_pool.stats()["available"], snap.pool.stats()["available"]), (0, 2))
+
+        body = first + b"".join([chunk async for chunk in chunks])
+        self.assertEqual(len(body.splitlines()), 111)
+        self.assertEqual(snap.export_pool.stats()["available"], 1)
+
+    async def test_busy(self):
+        with self.registry.current().export_pool.cursor():
+            response = await self.post("v1/export", {"group": "phones", "subject": {"phones": "996"}})
+        self.assertEqual(response.status_code, 503)
+
+
+class LookupViewTest(ApiTestCase):
+    async def test_rejects_bad_token(self):
+        payload = {"subject": {"lastname": "N1"}, "requested_groups": ["persons"]}
+        response = await self.post("v1/lookup", payload, Authorization="Bearer not-a-token")
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.post("/api/conn/v1/lookup", payload, content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+
+    async def test_timings_log(self):
+        payload = {"subject": {"lastname": "N1"}, "requested_groups": ["persons"]}
+        with self.assertNoLogs("connector.views", "INFO"):
+            await self.post("v1/lookup", payload)
+        # этапы быстрых запросов в лог идут только по debug
+        with self.assertLogs("connector.views", "INFO") as logs:
+            await self.post("v1/lookup", {**payload, "debug": True})
+        self.assertIn("stages", logs.output[0])
+
+    async def test_lookup(self):
+        response = await self.post("v1/lookup", {
+            "subject": {"lastname": "n1"}, "requested_groups": ["persons"], "paging": {"limit": 5}
+        })
+        self.assertEqual(response.status_code, 200)
+        group = response.json()["data"]["persons"]
+        self.assertEqual((group["status"], group["total"], group["returned"], group["next_offset"]), ("ok", 11, 5, 5))
+        first = group["results"][0]
+        self.assertEqual(first["lastname"], "N1")
+        self.assertEqual(sorted(p["phones"] for p in first["phone"]), ["9961", "996101", "996201"])
+
+
+class GroupConcurrencyTest(ApiTestCase):
+    groups = {
+        **ApiTestCase.groups,
+        # колонки missing в схеме нет: запрос группы падает в DuckDB
+        "broken": {
+            "from": {"schema": "persons", "select": {"x": "persons.missing"}, "where_any": {"lastname": "persons.lastname"}}
+        },
+    }
+
+    async def lookup(self, *groups):
+        response = await self.post("v1/lookup", {"subject": {"lastname": "N1"}, "requested_groups": list(groups)})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["data"]
+
+    async def test_group_error_is_isolated(self):
+        data = await self.lookup("broken", "persons")
+        self.assertEqual(data["broken"]["status"], "error")
+        self.assertIn("missing", data["broken"]["detail"])
+        self.assertEqual((data["persons"]["status"], data["persons"]["total"]), ("ok", 11))
+
+    async def test_pool_timeout_is_busy(self):
+        snap = self.registry.current()
+        with snap.pool.cursor(), snap.pool.cursor():
+            data = await self.lookup("persons", "phones")
+        self.assertEqual({name: group["status"] for name, group in data.items()}, {"persons": "busy", "phones": "busy"})
+
+        # busy не кэшируется: после освобождения курсоров группа выполняется
+        data = await self.lookup("persons")
+        self.assertEqual(data["persons"]["status"], "ok")
+
+
+class LookupCancelTest(ApiTestCase):
+    async def test_cancel_then_reload(self):
+        started, gate = threading.Event(), threading.Event()
+        results = []
+        run_group_pooled = views.run_group_pooled
+
+        def slow_group(*args):
+            started.set()
+            gate.wait(5)
+            results.append(json.loads(run_group_pooled(*args)))
+
+        old = self.registry.current()
+        loop = asyncio.get_running_loop()
+        with mock.patch.object(views, "run_group_pooled", slow_group):
+            request = asyncio.ensure_future(
+                self.post("v1/lookup", {"subject": {"lastname": "N1"}, "requested_groups": ["persons"]})
+            )
+            await loop.run_in_executor(None, started.wait, 5)
+            # клиент отключился, пока группа выполняется, затем снапшот подменили
+            request.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await request
+            self.registry.reload()
+            old.con.execute("SELECT 1")
+
+            # версию держит поток группы: она закрывается только после его завершения
+            gate.set()
+            for _ in range(100):
+                if old._refs == 0:
+                    break
+                await asyncio.sleep(0.05)
+        self.assertEqual(results[0]["status"], "ok")
+        with self.assertRaises(duckdb.ConnectionException):
+            old.con.execute("SELECT 1")
+
+
+class BlobViewTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        duckdb.sql(f"COPY (SELECT range AS person_id, ('img' || range)::BLOB AS photo FROM range(10)) "
+                   f"TO '{self.root}/document_images.parquet' (FORMAT parquet)")
+        cfg = snapshot.read_mapping(self.cfg_path)
+        cfg["schemas"]["document_images"] = {"path": "document_images.parquet"}
+        cfg["groups"]["images"] = {"from": {
+            "schema": "document_images",
+            "select": {"person_id": "document_images.person_id", "photo": "document_images.photo"},
+            "where_any": {"person_id": {"path": "document_images.person_id", "match": "exact"}},
+        }}
+        self.cfg_path.write_text(json.dumps(cfg))
+        self.registry.reload()
+        self.digest = hashlib.sha256(b"img7").hexdigest()
+
+    async def get(self, digest, **headers):
+        return await self.async_client.get(f"/api/conn/v1/blob/{digest}", headers={**self.auth, **headers})
+
+    def load_native(self):
+        snapshot.load_snapshot(snapshot.read_mapping(self.cfg_path), self.root)
+        self.registry.reload()
+
+    async def photo(self):
+        response = await self.post("v1/lookup", {"subject": {"person_id": "7"}, "requested_groups": ["images"]})
+        return response.json()["data"]["images"]["results"][0]["photo"]
+
+    async def test_unavailable_over_parquet(self):
+        response = await self.get(self.digest)
+        self.assertEqual(response.status_code, 503)
+        # ссылку на /v1/blob не разрешить - lookup отдаёт содержимое
+        self.assertEqual(await self.photo(), {"base64": base64.b64encode(b"img7").decode(), "size": 4})
+
+    async def test_reference_over_native(self):
+        self.load_native()
+        self.assertEqual(await self.photo(), {"sha256": self.digest, "size": 4})
+
+    async def test_etag_and_range(self):
+        self.load_native()
+        response = await self.get(self.digest)
+        self.assertEqual((response.status_code, response.content), (200, b"img7"))
+        etag = response["ETag"]
+
+        response = await self.get(self.digest, If_None_Match=etag)
+        self.assertEqual((response.status_code, response.content), (304, b""))
+
+        response = await self.get(self.digest, Range="bytes=1-2")
+        self.assertEqual((response.status_code, response.content), (206, b"mg"))
+        self.assertEqual(response["Content-Range"], "bytes 1-2/4")
+
+        response = await self.get(self.digest, Range="bytes=4-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */4"))
+
+        response = await self.get("0" * 64)
+        self.assertEqual(response.status_code, 404)
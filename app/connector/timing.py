@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Время этапов одного запроса в миллисекундах: {этап: ms}.
+    Повторный этап с тем же именем суммируется
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float):
+        self.stages[name] = round(self.stages.get(name, 0) + ms, 2)
+
+    def total(self) -> float:
+        return round(sum(self.stages.values()), 2)
+
+
+@contextmanager
+def stage(timer, name: str):
+    """
+    timer.stage(name), если timer передан, иначе ничего не измеряет
+    """
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def server_timing(stages: dict) -> str:
+    """
+    Значение заголовка Server-Timing: acquire;dur=0.4, groups;dur=12.1
+    """
+    return ", ".join(f"{name};dur={ms}" for name, ms in stages.items())
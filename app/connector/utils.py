@@ -1,6 +1,15 @@
+from collections import namedtuple
+from functools import lru_cache
 from pprint import pprint
+import logging
 import re
 
+from . import blobs, ngram, partitions
+from .paging import TOTAL_COLUMN, page_sql
+
+
+logger = logging.getLogger(__name__)
+
 
 # def sql_select_only(group_cfg):
 #     from_cfg = group_cfg["from"]
@@ -58,7 +67,115 @@ import re
 #     return sql
 
 
-def sql_select_only(group_cfg, subject):
+# поле похоже на дату - для запроса к базе приводим колонку к строке
+DATE_RE = re.compile(r'^\d{4}(-\d{2}){0,2}$')
+
+
+# режим поиска по полю where_any, задаётся в mapping.yml:
+# where_any:
+#   passport_number: {path: persons.passport_number, match: exact}
+MATCH_EXACT = 'exact'
+MATCH_PREFIX = 'prefix'
+MATCH_CONTAINS = 'contains'
+# варианты contains, выбираются по значению
+MATCH_DATE = 'date'
+MATCH_NGRAM = 'ngram'
+
+
+# метки в SQL групп с join, на их место fetch_page ставит LIMIT/OFFSET и оконный COUNT(*) главной таблицы
+PAGE_WINDOW = '/*page_window*/'
+PAGE_TOTAL = '/*page_total*/'
+PAGE_TOTAL_COLUMN = '/*page_total_column*/'
+MAIN_CTE = '__main'
+
+
+class CompiledQuery(namedtuple('CompiledQuery', ['sql', 'binds'])):
+    """
+    SQL группы с именованными параметрами $pN.
+    binds - {имя параметра: (поле subject, шаблон значения или функция от значения)}
+    """
+
+    def page_sql(self, window: str, with_total: bool) -> str:
+        """
+        SQL страницы для paging.fetch_page.
+        В запросах с join страница и total берутся по главной таблице внутри CTE,
+        поэтому присоединяемые схемы агрегируются только для ключей строк страницы
+        """
+        if PAGE_WINDOW not in self.sql:
+            return page_sql(self.sql, window, with_total)
+        sql = self.sql.replace(PAGE_WINDOW, window)
+        if with_total:
+            sql = sql.replace(PAGE_TOTAL, f", COUNT(*) OVER () AS {TOTAL_COLUMN}")
+            sql = sql.replace(PAGE_TOTAL_COLUMN, f", {TOTAL_COLUMN}")
+        return sql
+
+    def params(self, subject: dict) -> dict:
+        return {
+            name: pattern(subject[field]) if callable(pattern) else pattern.format(subject[field])
+            for name, (field, pattern) in self.binds.items()
+        }
+
+
+class QueryCompiler:
+    """
+    Компилирует SQL групп из mapping.yml один раз на (группа, форма запроса)
+    и держит результат в LRU. На запрос остаётся только подставить значения
+    """
+
+    def __init__(self, groups: dict, maxsize: int, ngram_columns=frozenset(), partition_specs=None, blob_refs=False):
+        self.groups = groups
+        # True - blob отдаются ссылкой {sha256, size} на /v1/blob, False - содержимым inline
+        self.blob_refs = blob_refs
+        self.ngram_columns = ngram_columns
+        self.partition_specs = partition_specs or {}
+        self._compile = lru_cache(maxsize=maxsize)(self._build)
+
+    def compile(self, group_name, subject: dict) -> CompiledQuery:
+        return self._compile(group_name, query_shape(self.groups[group_name], subject, self.ngram_columns))
+
+    def _build(self, group_name, shape) -> CompiledQuery:
+        query = build_sql(self.groups[group_name], shape, self.partition_specs, self.blob_refs)
+        logger.debug(f"Compiled {group_name} {shape}: {query.sql}")
+        return query
+
+    def stats(self) -> dict:
+        info = self._compile.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+
+
+def query_shape(group_cfg, subject: dict, ngram_columns=frozenset()) -> tuple:
+    """
+    Форма запроса: какие поля where_any пришли и как по ним искать.
+    Запросы одной формы отличаются только значениями параметров
+    """
+    schema = group_cfg["from"]["schema"]
+    shape = []
+    for field, field_cfg in group_cfg["from"]["where_any"].items():
+        if field not in subject:
+            continue
+        val = subject[field]
+        match = field_match(field_cfg)
+        if match != MATCH_CONTAINS:
+            shape.append((field, match))
+        elif DATE_RE.search(val):
+            shape.append((field, MATCH_DATE))
+        elif (schema, field) in ngram_columns and ngram.usable(val):
+            shape.append((field, MATCH_NGRAM))
+        else:
+            shape.append((field, MATCH_CONTAINS))
+    return tuple(shape)
+
+
+def field_match(field_cfg) -> str:
+    """
+    Режим поиска поля where_any: exact, prefix или contains (по умолчанию)
+    """
+    if isinstance(field_cfg, dict):
+        return field_cfg.get("match", MATCH_CONTAINS)
+    return MATCH_CONTAINS
+
+
+def sql_select_only(group_cfg, join_fields, bind, join_filters=None, source=None, blob_refs=False):
     from_cfg = group_cfg["from"]
     schema = from_cfg["schema"]  # название таблицы
 
@@ -76,11 +193,12 @@ def sql_select_only(group_cfg, subject):
     join_cols = {}
     for alias, src in select_map.items():
         join_schema_name = src.split('.')[0]
+        # фото и подпись - ссылка {sha256, size}, само содержимое отдаёт /v1/blob;
+        # снапшот поверх parquet индекса blob не имеет, и содержимое идёт в ответе
+        if alias in blobs.BLOB_ALIASES:
+            src = blobs.reference_sql(src) if blob_refs else blobs.inline_sql(src)
         if join_schema_name in join_schemas:
-            if alias in ('photo', 'signature'):
-                join_cols.setdefault(join_schema_name, []).append(f"{alias}:=base64({src})")
-            else:
-                join_cols.setdefault(join_schema_name, []).append(f"{alias}:={src}")
+            join_cols.setdefault(join_schema_name, []).append(f"{alias}:={src}")
         else:
             cols.append(f"{src} AS {alias}")
 
@@ -96,54 +214,99 @@ def sql_select_only(group_cfg, subject):
                         f"FROM {join_schema_name} ")
 
         filter_cols = []
-        for up_field in subject:
+        for up_field in join_fields:
             if join_schema_name in up_field:
-                val = subject[up_field]
                 low_field = up_field.split('.')[1]   # example: phone.phones -> phones
-                filter_cols.append(f"{low_field} = {val} ")
+                filter_cols.append(f"{low_field} = {bind(up_field, '{}')} ")
+        for join_filter in (join_filters or {}).get(join_schema_name, []):
+            filter_cols.append(f"{join_filter} ")
 
         if filter_cols:
-            inner_select += 'WHERE ' + ', '.join(filter_cols)
+            inner_select += 'WHERE ' + 'AND '.join(filter_cols)
 
         inner_select +=  f"GROUP BY {general_filed}"
         join_selects[join_schema_name] = inner_select
 
     cols = ", ".join(cols)
-    sql_only_select = f"SELECT {cols} FROM {schema}"
+    sql_only_select = f"SELECT {cols} FROM {source or schema}"
     return sql_only_select, join_selects
 
 
-def build_sql(group_cfg, subject: dict) -> str:
+def build_sql(group_cfg, shape: tuple, partition_specs=None, blob_refs=False) -> CompiledQuery:
+    """
+    Собирает SQL группы для формы запроса (см. query_shape).
+    Значения subject в текст запроса не попадают, только параметры $pN.
+    partition_specs - {схема: (колонка, число бакетов)} для схем с partition_by,
+    blob_refs - ссылки на blob вместо содержимого (см. sql_select_only)
+    """
     from_cfg = group_cfg["from"]
-    join_subjects = {}
+    join_fields = []
+    binds = {}
+
+    def bind(field, pattern):
+        name = f"p{len(binds)}"
+        binds[name] = (field, pattern)
+        return f"${name}"
 
     # WHERE
     conditions = []
-    for field, _ in from_cfg["where_any"].items():
-        if field in subject:
-            val = subject[field]
+    for field, match in shape:
+        if len(field.split('.')) == 2:
+            join_fields.append(field)
+            continue
 
-            if len(field.split('.')) == 2:
-                join_subjects[field] = val
-                continue
+        if match == MATCH_EXACT:   # равенство и префикс используют min/max статистику row group
+            conditions.append(f"{field} = {bind(field, '{}')}")
+            continue
 
-            if bool(re.search(r'^\d{4}(-\d{2}){0,2}$', val)):   # проверка на дату, для запроса к базе
-                conditions.append(f"CAST({field} AS VARCHAR) LIKE '%{val}%'")
-            else:
-                conditions.append(f"{field} LIKE '%{val}%'")
+        if match == MATCH_PREFIX:
+            conditions.append(f"{field} LIKE {bind(field, '{}%')}")
+            continue
 
-    sql_only_select, join_selects = sql_select_only(group_cfg, join_subjects)
+        if match == MATCH_DATE:   # проверка на дату, для запроса к базе
+            conditions.append(f"CAST({field} AS VARCHAR) LIKE {bind(field, '%{}%')}")
+            continue
 
-    # JOIN
-    if "join" in from_cfg:
-        for j in from_cfg["join"]:
-            join_schema_name = j['schema']
-            if join_schema_name not in join_selects:
-                continue
-            sql_only_select += f" LEFT JOIN ({join_selects[join_schema_name]}) {join_schema_name} ON {j['on']}"
+        if match == MATCH_NGRAM:   # сначала кандидаты из n-gram индекса, LIKE перепроверяет
+            conditions.append(ngram.probe_condition(from_cfg["schema"], field, bind(field, ngram.ngrams)))
+        conditions.append(f"{field} LIKE {bind(field, '%{}%')}")
+
+    schema = from_cfg["schema"]
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # присоединяемые схемы, поля которых есть в select
+    selected = {src.split('.')[0] for src in from_cfg["select"].values()}
+    joins = [j for j in from_cfg.get("join", []) if j['schema'] in selected]
+    if not joins:
+        sql_only_select, _ = sql_select_only(group_cfg, join_fields, bind, blob_refs=blob_refs)
+        return CompiledQuery(sql_only_select + where, binds)
 
-    sql = sql_only_select
-    if conditions:
-        sql += f" WHERE " + " AND ".join(conditions)
+    join_filters = {}
+    for j in joins:
+        main_key, join_column = partitions.join_keys(j)
+        # semi-join: схема агрегируется только по ключам строк главной таблицы из CTE (страницы)
+        join_filters[j['schema']] = [f"{join_column} IN (SELECT {main_key} FROM {MAIN_CTE} AS {schema})"]
+
+        # схема с partition_by читает только бакеты ключей строк из CTE
+        spec = (partition_specs or {}).get(j['schema'])
+        if spec and spec[0] == join_column:
+            column, buckets = spec
+            join_filters[j['schema']].append(
+                f"{partitions.bucket_column(column)} IN "
+                f"(SELECT {partitions.bucket_sql(main_key, buckets)} FROM {MAIN_CTE} AS {schema})"
+            )
+
+    sql_only_select, join_selects = sql_select_only(
+        group_cfg, join_fields, bind, join_filters, source=f"{MAIN_CTE} AS {schema}", blob_refs=blob_refs
+    )
+    # колонка total проходит из CTE в результат, когда fetch_page её запрашивает
+    sql_only_select = sql_only_select.replace(f" FROM {MAIN_CTE} AS ", f"{PAGE_TOTAL_COLUMN} FROM {MAIN_CTE} AS ", 1)
+
+    # JOIN
+    for j in joins:
+        join_schema_name = j['schema']
+        sql_only_select += f" LEFT JOIN ({join_selects[join_schema_name]}) {join_schema_name} ON {j['on']}"
 
-    return sql
+    # фильтр и страница - по главной таблице, до join
+    main_cte = f"WITH {MAIN_CTE} AS MATERIALIZED (SELECT *{PAGE_TOTAL} FROM {schema}{where} {PAGE_WINDOW}) "
+    return CompiledQuery(main_cte + sql_only_select, binds)
@@ -1,69 +1,95 @@
-from duckdb.duckdb import limit
 from ninja import Router, Body
-import duckdb, hashlib, time, json, yaml, logging
-from pathlib import Path
-from .utils import build_sql
-from ninja_jwt.authentication import JWTAuth
-from jose import jwt
-import os
-from project.settings_local import SNAPSHOT_PATH, SECRETS_PATH
-import datetime
-import base64
-from pprint import pprint
+import asyncio, threading, time, logging
+from concurrent.futures import ThreadPoolExecutor
+from . import blobs, metrics, snapshot
+from .config import (
+    CFG_PATH, CONNECTOR_POOL_SIZE, CONNECTOR_POOL_TIMEOUT, CONNECTOR_EXECUTOR_WORKERS, CONNECTOR_QUERY_CACHE_SIZE,
+    CONNECTOR_CACHE_BYTES, CONNECTOR_CACHE_REDIS_URL, CONNECTOR_CACHE_TTL, CONNECTOR_SNAPSHOT_POLL_INTERVAL,
+    CONNECTOR_VERIFY_REDIS_URL, CONNECTOR_VERIFY_TTL, CONNECTOR_EXPORT_BATCH_ROWS, CONNECTOR_EXPORT_CONCURRENCY, CONNECTOR_SIGNING_MODE,
+    CONNECTOR_DEBUG_TIMINGS, CONNECTOR_TIMINGS_LOG_MS, CONNECTOR_PROFILE_SLOW_MS, CONNECTOR_PROFILE_INTERVAL, CONNECTOR_METRICS_TOKEN,
+    CONNECTOR_METRICS_NETWORKS,
+)
+from .profiling import SlowQueryProfiler
+from .timing import StageTimer, server_timing
+from .signing import ResponseSigner
+from .cache import LookupCache
+from .serialize import table_to_json, dumps, Fragment
+from django.http import HttpResponse, StreamingHttpResponse
+from .export import ndjson_chunks, arrow_chunks, CONTENT_TYPES, FORMAT_NDJSON, FORMAT_ARROW
+from .integrity import VerificationStore, VERIFY_PENDING, VERIFY_RUNNING, VERIFY_OK, VERIFY_FAILED, VERIFY_ERROR
+from celery import current_app
+from .pool import PoolTimeout
+from .paging import fetch_page, TOTAL_MODES, TOTAL_EXACT
+from .auth import CachedJWTAuth, AsyncCachedJWTAuth, USER_CACHE
+from project.settings_local import SECRETS_PATH
 
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
-# --- Прописываем пути к файлам снапшота---
-CFG_PATH = Path(f"{SNAPSHOT_PATH}/mapping.yml").resolve()
-CFG = yaml.safe_load(CFG_PATH.read_text(encoding="utf-8"))
+# текущая версия снапшота (mapping.yml, DuckDB, пул курсоров, компилятор запросов),
+# подменяется без рестарта воркера при изменении файлов снапшота
+REGISTRY = snapshot.SnapshotRegistry(
+    CFG_PATH, CONNECTOR_POOL_SIZE, CONNECTOR_POOL_TIMEOUT, CONNECTOR_QUERY_CACHE_SIZE, CONNECTOR_SNAPSHOT_POLL_INTERVAL,
+    CONNECTOR_EXPORT_CONCURRENCY
+)
 
-STORAGE_ROOT = Path(CFG["storage"]["root"])
-STORAGE_ROOT.mkdir(parents=True, exist_ok=True)
+# кэш результатов групп, ключ включает версию снапшота
+CACHE = LookupCache(CONNECTOR_CACHE_BYTES, CONNECTOR_CACHE_REDIS_URL, CONNECTOR_CACHE_TTL)
 
-# переменная определяет наличие соединения к duckdb
-_DB = None
+# ограниченный пул потоков для DuckDB и подписи, чтобы не блокировать event loop
+# и не занимать поток sync_to_async Django
+EXECUTOR = ThreadPoolExecutor(max_workers=CONNECTOR_EXECUTOR_WORKERS, thread_name_prefix='connector')
 
+# EXPLAIN ANALYZE медленных запросов групп в QueryProfile
+PROFILER = SlowQueryProfiler(CONNECTOR_PROFILE_SLOW_MS, CONNECTOR_PROFILE_INTERVAL, EXECUTOR)
 
-def get_db():
-    """Ленивое подключение к DuckDB (всегда файл, не :memory:)"""
-    global _DB
-    if _DB is None:
-        _DB = duckdb.connect()
-        logger.info(f"Connected to DuckDB")
-    return _DB
+# подпись ответов, ключ перечитывается только при изменении private.pem
+SIGNER = ResponseSigner(SECRETS_PATH, CONNECTOR_SIGNING_MODE)
 
+# статусы фоновой проверки версий снапшота (connector.tasks.verify_snapshot)
+VERIFY_STORE = VerificationStore(CONNECTOR_VERIFY_REDIS_URL, CONNECTOR_VERIFY_TTL)
 
-@router.get("/v1/check-hash", response={200: str, 400: str}, auth=JWTAuth())
+
+@router.get("/v1/check-hash", response={200: dict, 202: dict, 400: dict, 503: dict}, auth=CachedJWTAuth())
+@metrics.track('check-hash')
 def check_hash(request):
     """
-    Сверяет хэши файлов баз parquet с указанными в manifest
+    Статус проверки хэшей файлов текущей версии снапшота с manifest.
+    Проверку выполняет задача Celery connector.tasks.verify_snapshot, здесь только читается её результат.
+    Если версию ещё не проверяли - проверка ставится в очередь, ответ 202
     """
-    # проверка подписи
-    schemas = CFG["schemas"]
-    manifest_file = STORAGE_ROOT / CFG["storage"].get("manifest", "manifest.json")
-
-    if manifest_file.exists():
-        try:
-            manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
-            hashes_dict = manifest.get("hashes", {})
-            for schema in schemas:
-                parquet_file_name = schemas[schema].get('path')
-                parquet_file_path = STORAGE_ROOT / parquet_file_name
-                exp = hashes_dict.get(parquet_file_name).split(":", 1)[1]
-                real = hashlib.sha256(parquet_file_path.read_bytes()).hexdigest()
-                if real != exp:
-                    return 400, 'Хэши не совпадают'
-                return 200, 'Хэши совпали'
-
-        except Exception as e:
-            logger.warning(f"Failed to read manifest.json: {e}")
-
-
-@router.post("/v1/lookup", auth=JWTAuth())
-def lookup(request, payload: dict = Body(...)):
+    snap = REGISTRY.current()
+    try:
+        status = VERIFY_STORE.get(snap.version)
+        if status is not None and status["status"] == VERIFY_RUNNING and not VERIFY_STORE.running(snap.version):
+            # воркер упал посреди проверки, его захват истёк - проверка ставится в очередь заново
+            status = None
+            VERIFY_STORE.forget(snap.version)
+        if status is None and VERIFY_STORE.claim(snap.version):
+            try:
+                current_app.send_task('connector.tasks.verify_snapshot', args=[snap.version], retry=False)
+            except Exception:
+                VERIFY_STORE.forget(snap.version)
+                raise
+            status = VERIFY_STORE.get(snap.version) or {"version": snap.version, "status": VERIFY_PENDING}
+    except Exception as e:
+        logger.warning(f"Snapshot verification status unavailable: {e}")
+        return 503, {"detail": f"Статус проверки недоступен: {e}"}
+
+    if status["status"] == VERIFY_OK:
+        return 200, {"detail": "Хэши совпали", **status}
+    if status["status"] == VERIFY_FAILED:
+        return 400, {"detail": "Хэши не совпадают", **status}
+    if status["status"] == VERIFY_ERROR:
+        return 400, {"detail": "Проверка не удалась", **status}
+    return 202, {"detail": "Проверка выполняется", **status}
+
+
+@router.post("/v1/lookup", auth=AsyncCachedJWTAuth())
+@metrics.track('lookup')
+async def lookup(request, payload: dict = Body(...)):
     """
     Пример тела запроса:
     {
@@ -72,67 +98,55 @@ def lookup(request, payload: dict = Body(...)):
       "requested_groups": ["passports_general"],
       "paging": {"limit": 100, "offset": 0, "returned": 100, "total": 980, "has_more": true, "next_offset":400}
     }
+    paging.total_mode: exact (по умолчанию), estimate или none - см. paging.fetch_page
+    "debug": true - время этапов по группам в timings ответа и заголовок Server-Timing
     """
 
     source_id = payload.get("requested_sources", "DEMO")
-    subject = {k: v.upper() for k, v in payload.get("subject", {}).items() if bool(v)}
+    subject = normalize_subject(payload)
     if not subject:
         return {'204': 'Все поля пустые'}
     requested_groups = payload.get("requested_groups", []) or []
 
+    paging = payload.get("paging", {})
+    offset = int(paging.get("offset", 0))
+    limit = int(paging.get("limit", 500))
+    total_mode = paging.get("total_mode", TOTAL_EXACT)
+    if total_mode not in TOTAL_MODES:
+        total_mode = TOTAL_EXACT
+
+    debug = bool(payload.get("debug")) and CONNECTOR_DEBUG_TIMINGS
+    timer = StageTimer()
+    group_timers = {group_name: StageTimer() for group_name in requested_groups}
+
     start = time.time()
-    data = {}
-    con = get_db()
-
-    for group_name in requested_groups:
-        paging = payload.get("paging", {})
-        offset = int(paging.get("offset", 0))
-        limit = int(paging.get("limit", 500))
-
-        group_cfg = CFG.get("groups", {}).get(group_name)
-
-        if not group_cfg:
-            logger.info(f'Такой группы в mapping.yml нет: {group_name}')
-            continue
-        sql = build_sql(group_cfg, subject)
-        pprint(sql)
-        if sql is None:
-            continue
-
-        sql_parquet = sql_convert_parquet(group_cfg, sql)
-
-
-        # Подсчёт общего количества строк
-        count_sql = f"SELECT COUNT(*) AS total FROM ({sql_parquet})"
-        total_rows = con.execute(count_sql).fetchone()[0]
-
-        # Добавляем пагинацию
-        paginated_sql = f"{sql_parquet} LIMIT {limit} OFFSET {offset}"  # return 0 - 100 results
-        # Получаем только текущую страницу
-        result = con.execute(paginated_sql).fetch_arrow_table()
-        group_data = []
-        returned = 0
-        for batch in result.to_batches():
-            for row in batch.to_pylist():
-                returned += 1
-                group_data.append(row)
-
-        has_next = True
-        next_offset = limit + offset
-        if total_rows < limit + offset:
-            has_next = False
-            next_offset = False
-
-        # Добавляем метаданные о пагинации
-        data[group_name] = {
-            "total": total_rows,
-            "returned": returned,
-            "offset": offset,
-            "limit": limit,
-            "has_next": has_next,
-            "next_offset": next_offset,
-            "results": group_data
-        }
+    loop = asyncio.get_running_loop()
+
+    # все группы запроса читают одну версию снапшота, даже если её подменят во время запроса
+    with timer.stage('acquire'):
+        acquired = EXECUTOR.submit(REGISTRY.acquire)
+        try:
+            snap = await asyncio.wrap_future(acquired)
+        except asyncio.CancelledError:
+            # клиент отключился, пока версия захватывалась: отпускаем её, когда acquire всё же завершится
+            acquired.add_done_callback(release_acquired)
+            raise
+    # группы выполняются параллельно, каждая на своём курсоре из пула
+    futures = [
+        EXECUTOR.submit(
+            run_group_pooled, snap, group_name, subject, limit, offset, total_mode, group_timers[group_name]
+        )
+        for group_name in requested_groups
+    ]
+    release_after(snap, futures)
+    with timer.stage('groups'):
+        results = await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+    # группы уже сериализованы в JSON, в ответ вставляются без повторного кодирования
+    data = {
+        group_name: Fragment(group_data)
+        for group_name, group_data in zip(requested_groups, results)
+        if group_data is not None
+    }
 
     latency = int((time.time() - start) * 1000)
     response = {
@@ -142,31 +156,310 @@ def lookup(request, payload: dict = Body(...)):
         "latency_ms": latency,
         "data": data
     }
+    group_stages = {group_name: group_timer.stages for group_name, group_timer in group_timers.items()}
+    groups = snap.cfg.get("groups", {})
+    for group_name, group_timer in group_timers.items():
+        metrics.GROUP_SECONDS.labels(metrics.group_label(groups, group_name)).observe(group_timer.total() / 1000)
+    if debug:
+        response["timings"] = group_stages
+
+    with timer.stage('encode'):
+        body = dumps(response)
+    with timer.stage('sign'):
+        body, headers = await loop.run_in_executor(EXECUTOR, jwt_encode_service, body)
+    metrics.SIGN_SECONDS.observe(timer.stages['sign'] / 1000)
+
+    elapsed = int((time.time() - start) * 1000)
+    if debug or elapsed >= CONNECTOR_TIMINGS_LOG_MS:
+        logger.info(f"Lookup {source_id} {elapsed} ms, stages {timer.stages}, groups {group_stages}")
+    if debug:
+        # подпись идёт после сборки тела, поэтому этапы запроса - в заголовке
+        headers["Server-Timing"] = server_timing(timer.stages)
+    return HttpResponse(body, content_type="application/json", headers=headers)
+
+
+def release_acquired(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().release()
+
+
+def release_after(snap, futures):
+    """
+    Отпускает версию снапшота, когда завершатся потоки всех групп.
+    Отмена корутины lookup (клиент отключился) потоки не останавливает: до их завершения
+    выведенная из работы версия не закрывается под выполняющимися запросами
+    """
+    if not futures:
+        snap.release()
+        return
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = not remaining[0]
+        if last:
+            snap.release()
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+def normalize_subject(payload: dict) -> dict:
+    return {k: v.upper() for k, v in payload.get("subject", {}).items() if bool(v)}
+
+
+@router.post("/v1/export", response={400: dict, 404: dict, 503: dict}, auth=AsyncCachedJWTAuth())
+@metrics.track('export')
+async def export(request, payload: dict = Body(...)):
+    """
+    Потоковая выгрузка всех строк одной группы без пагинации, запрос выполняется один раз.
+    {
+      "group": "persons_general",
+      "subject": { "person_lastname_kyr": "Осмоналиев" },
+      "format": "ndjson"
+    }
+    format: ndjson (по умолчанию) или arrow (Arrow IPC stream)
+    """
+    group_name = payload.get("group")
+    fmt = payload.get("format", FORMAT_NDJSON)
+    if fmt not in CONTENT_TYPES:
+        return 400, {"detail": f"Неизвестный формат: {fmt}"}
+    subject = normalize_subject(payload)
+    if not subject:
+        return 400, {"detail": "Все поля пустые"}
+
+    # первая загрузка снапшота блокирующая, поэтому в EXECUTOR
+    snap = await asyncio.get_running_loop().run_in_executor(EXECUTOR, REGISTRY.current)
+    if group_name not in snap.cfg.get("groups", {}):
+        return 404, {"detail": f"Такой группы в mapping.yml нет: {group_name}"}
+
+    chunks = export_chunks(group_name, subject, fmt)
+    # первый шаг генератора берёт курсор выгрузки: если все заняты, ответ 503, а не оборванный поток
+    try:
+        await asyncio.get_running_loop().run_in_executor(EXECUTOR, next, chunks)
+    except PoolTimeout as e:
+        return 503, {"detail": str(e)}
+    response = StreamingHttpResponse(iterate_in_executor(chunks), content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{group_name}.{fmt}"'
+    return response
+
+
+def export_chunks(group_name, subject, fmt):
+    """
+    Блокирующая часть выгрузки: версия снапшота и курсор из snap.export_pool держатся, пока идёт поток,
+    и освобождаются при его завершении или обрыве соединения.
+    Первым отдаётся пустой кусок, когда курсор получен, дальше - данные
+    """
+    try:
+        with REGISTRY.using() as snap, snap.export_pool.cursor() as con:
+            yield b''
+            query = snap.compiler.compile(group_name, subject)
+            stream = arrow_chunks if fmt == FORMAT_ARROW else ndjson_chunks
+            size = 0
+            for chunk in stream(con, query.sql, query.params(subject), CONNECTOR_EXPORT_BATCH_ROWS):
+                size += len(chunk)
+                yield chunk
+            metrics.RESPONSE_BYTES.labels('export').observe(size)
+    except PoolTimeout:
+        raise
+    except Exception as e:
+        # статус ответа уже отправлен, ошибку можно только залогировать и оборвать поток
+        logger.exception(f'Ошибка выгрузки группы {group_name}: {e}')
+        raise
+
+
+async def iterate_in_executor(chunks):
+    """
+    Отдаёт куски синхронного генератора в ASGI, каждый следующий кусок читается в EXECUTOR
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(EXECUTOR, next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await loop.run_in_executor(EXECUTOR, chunks.close)
+
+
+def run_group_pooled(snap, group_name, subject, limit, offset, total_mode, timer=None):
+    """
+    Выполняет одну группу на своём курсоре из пула (блокирующая часть lookup),
+    возвращает JSON группы (bytes). Ошибка группы не роняет весь ответ, а попадает в её status
+    """
+    group_cfg = snap.cfg.get("groups", {}).get(group_name)
+
+    if not group_cfg:
+        logger.info(f'Такой группы в mapping.yml нет: {group_name}')
+        return None
+
+    timer = timer or StageTimer()
+    with timer.stage('cache'):
+        CACHE.set_version(snap.version)
+        paging = {"limit": limit, "offset": offset, "total_mode": total_mode}
+        cache_key = CACHE.make_key(snap.version, group_name, subject, paging)
+        cached = CACHE.get(cache_key)
+    if cached is not None:
+        metrics.GROUP_STATUS.labels(group_name, 'cached').inc()
+        return cached
+
+    try:
+        wait_start = time.perf_counter()
+        with snap.pool.cursor() as con:
+            timer.add('wait', (time.perf_counter() - wait_start) * 1000)
+            group_data = run_group(snap, con, group_name, subject, limit, offset, total_mode, timer)
+    except PoolTimeout as e:
+        metrics.GROUP_STATUS.labels(group_name, 'busy').inc()
+        return dumps({"status": "busy", "detail": str(e)})
+    except Exception as e:
+        logger.exception(f'Ошибка запроса группы {group_name}: {e}')
+        metrics.GROUP_STATUS.labels(group_name, 'error').inc()
+        return dumps({"status": "error", "detail": str(e)})
+
+    if group_data is None:
+        return None
+    with timer.stage('serialize'):
+        group_json = dumps({"status": "ok", **group_data})
+    CACHE.set(cache_key, group_json)
+    metrics.GROUP_STATUS.labels(group_name, 'ok').inc()
+    return group_json
+
+
+def run_group(snap, con, group_name, subject, limit, offset, total_mode=TOTAL_EXACT, timer=None):
+    """
+    Выполняет запрос одной группы на переданном курсоре,
+    возвращает страницу результатов с метаданными пагинации.
+    results - готовый JSON строк страницы (Fragment), python объекты на строку не создаются.
+    Этапы пишутся в timer: compile, params, page, count, serialize
+    """
+    timer = timer or StageTimer()
+    with timer.stage('compile'):
+        query = snap.compiler.compile(group_name, subject)
+    with timer.stage('params'):
+        params = query.params(subject)
+
+    # Страница и общее количество строк за один проход
+    result, total_rows, has_next = fetch_page(con, query, params, limit, offset, total_mode, timer)
+    fetch_ms = round(timer.stages.get('page', 0) + timer.stages.get('count', 0), 2)
+    PROFILER.maybe_capture(
+        snap, group_name, query.page_sql(f"LIMIT {limit} OFFSET {offset}", total_mode == TOTAL_EXACT), params, fetch_ms
+    )
+
+    metrics.GROUP_ROWS.labels(group_name).observe(result.num_rows)
+    next_offset = limit + offset if has_next else False
+    with timer.stage('serialize'):
+        results_json = table_to_json(con, result)
+
+    # Добавляем метаданные о пагинации
+    return {
+        "total": total_rows,
+        "returned": result.num_rows,
+        "offset": offset,
+        "limit": limit,
+        "has_next": has_next,
+        "next_offset": next_offset,
+        "results": Fragment(results_json),
+    }
+
 
-    return jwt_encode_service(response)
+@router.get("/v1/blob/{sha256}", response={503: dict}, auth=AsyncCachedJWTAuth())
+@metrics.track('blob')
+async def blob(request, sha256: str):
+    """
+    Содержимое фото или подписи по ссылке {sha256, size} из ответа lookup.
+    Содержимое неизменно для хэша: ETag/If-None-Match отдаёт 304, поддерживается Range.
+    Blob ищется по индексу нативного снапшота, пока снапшот читается из parquet - 503
+    (ссылок тогда и нет: lookup отдаёт содержимое inline)
+    """
+    if not blobs.SHA256_RE.match(sha256):
+        return HttpResponse(status=404)
+
+    etag = f'"{sha256}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable", "Accept-Ranges": "bytes"}
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        return HttpResponse(status=304, headers=headers)
+
+    data, indexed = await asyncio.get_running_loop().run_in_executor(EXECUTOR, find_blob, sha256)
+    if not indexed:
+        return 503, {"detail": "Индекс blob не построен: снапшот не загружен в DuckDB (snapshot_load)"}
+    if data is None:
+        return HttpResponse(status=404)
+
+    size = len(data)
+    try:
+        byte_range = blobs.parse_range(request.headers.get("Range", ""), size)
+    except ValueError:
+        return HttpResponse(status=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return HttpResponse(data, content_type="application/octet-stream", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return HttpResponse(data[start:end + 1], status=206, content_type="application/octet-stream", headers=headers)
+
+
+def find_blob(sha256):
+    """
+    (содержимое или None, есть ли индекс blob в текущей версии снапшота)
+    """
+    with REGISTRY.using() as snap:
+        if not snap.blob_indexed:
+            return None, False
+        with snap.pool.cursor() as con:
+            return blobs.find(con, snap.blob_indexed, sha256), True
+
+
+@router.get("/v1/stats", auth=CachedJWTAuth())
+def stats(request):
+    """
+    Метрики воркера: пул курсоров DuckDB, кэш скомпилированных запросов, кэш результатов, кэш пользователей JWT
+    """
+    snap = REGISTRY.current()
+    return {
+        "snapshot": snap.version,
+        "pool": snap.pool.stats(),
+        "export_pool": snap.export_pool.stats(),
+        "queries": snap.compiler.stats(),
+        "cache": CACHE.stats(),
+        "auth": USER_CACHE.stats(),
+    }
+
+
+def metrics_view(request):
+    """
+    Метрики Prometheus всех воркеров (см. connector.metrics), подключается в project/urls.py как /metrics.
+    Доступ - см. CONNECTOR_METRICS_TOKEN и CONNECTOR_METRICS_NETWORKS
+    """
+    if not metrics.allowed(request, CONNECTOR_METRICS_TOKEN, CONNECTOR_METRICS_NETWORKS):
+        return HttpResponse(status=403)
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)
 
 
 @router.get('test-tables')
 def get_test(request):
-    formularerr = CFG.get("groups", {}).get('tformularerr')
-    tresult = CFG.get("groups", {}).get('tresult')
+    snap = REGISTRY.current()
+    formularerr = snap.cfg.get("groups", {}).get('tformularerr')
+    tresult = snap.cfg.get("groups", {}).get('tresult')
 
     formularerr_cfg = formularerr["from"]
     tresult_cfg = tresult['from']
 
-    formularerr_schema_path = CFG['schemas'].get('tformularerr').get('path')
-    tresult_schema_path = CFG['schemas'].get('tresult').get('path')
+    formularerr_schema_path = snap.cfg['schemas'].get('tformularerr').get('path')
+    tresult_schema_path = snap.cfg['schemas'].get('tresult').get('path')
 
-    path_one = (STORAGE_ROOT / formularerr_schema_path).resolve()
-    path_two = (STORAGE_ROOT / tresult_schema_path).resolve()
-
-    con = get_db()
+    path_one = (snap.storage_root / formularerr_schema_path).resolve()
+    path_two = (snap.storage_root / tresult_schema_path).resolve()
 
     select_formular = rf"SELECT * FROM read_parquet('{path_one}') AS tformularerr LIMIT 1"
     select_result = rf"SELECT * FROM read_parquet('{path_two}') AS tresult LIMIT 1"
 
-    result_formularerr = con.execute(select_formular).fetch_arrow_table()
-    result_result = con.execute(select_result).fetch_arrow_table()
+    with REGISTRY.using() as snap, snap.pool.cursor() as con:
+        result_formularerr = con.execute(select_formular).fetch_arrow_table()
+        result_result = con.execute(select_result).fetch_arrow_table()
     data = []
     for batch in result_formularerr.to_batches():
         for row in batch.to_pylist():
@@ -178,50 +471,9 @@ def get_test(request):
 
 
 
-def sql_convert_parquet(group_cfg, sql) -> str:
-    """
-    Получает голый sql запрос,
-    Возвращает запрос к файлам 'parquet' на основе путей из group_cfg
-    """
-    schema = group_cfg['from']
-    schema_name = schema['schema']
-    join_schemas = schema.get('join')
-
-    # schema_name
-    schema_cfg = CFG.get("schemas").get(schema_name)
-    parquet_file = schema_cfg.get('path')
-    parquet_path = (STORAGE_ROOT / parquet_file).resolve()
-
-    sql = sql.replace(f"FROM {schema_name}", f"FROM read_parquet('{parquet_path}') AS {schema_name}")
-    # если есть JOIN в группе group_cfg
-    if join_schemas:
-        for join_schema in join_schemas:
-            join_schema_name = join_schema.get("schema")
-            schema_cfg = CFG.get("schemas").get(join_schema_name)
-            parquet_file = schema_cfg.get("path")
-            parquet_path = (STORAGE_ROOT / parquet_file).resolve()
-            if join_schema_name == 'document_images':
-                sql = sql.replace(f"FROM {join_schema_name}", f"FROM read_parquet('{parquet_path}/*.parquet') AS {join_schema_name}")
-            else:
-                sql = sql.replace(f"FROM {join_schema_name}", f"FROM read_parquet('{parquet_path}') AS {join_schema_name}")
-
-    return sql
-
-
-def jwt_encode_service(body):
+def jwt_encode_service(body: bytes):
     """
-    преобразует тело в jwt строку
+    Подписывает готовый JSON ответа (bytes), см. signing.ResponseSigner.
+    Возвращает (тело, заголовки ответа)
     """
-
-    if not SECRETS_PATH:
-        return body
-
-    private_pem_path = f"{SECRETS_PATH}/private.pem"
-    if os.path.exists(private_pem_path):
-        with open(private_pem_path, "rb") as f:
-            private_pem = f.read()
-            jws_token = jwt.encode(body, private_pem, algorithm="RS256")
-        return {"jwt": jws_token}
-
-    return body
-
+    return SIGNER.sign(body)
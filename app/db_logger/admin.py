@@ -2,19 +2,87 @@ from __future__ import unicode_literals
 import logging
 
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 
 from .models import StatusLog
+from .search import search_query, search_vector
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Число строк списка по оценке планировщика PostgreSQL (EXPLAIN) вместо точного COUNT(*),
+    который на больших таблицах дольше самой страницы. Небольшие выборки считаются точно
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            estimate = int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+        if estimate < self.exact_below:
+            return super().count
+        return estimate
+
+
+class LoggerNameFilter(admin.SimpleListFilter):
+    """
+    Фильтр по logger_name. Вместо SELECT DISTINCT по всей таблице имена собираются рекурсивным запросом:
+    каждый шаг - поиск следующего имени по индексу (logger_name, create_datetime), логгеров единицы
+    """
+    title = 'logger name'
+    parameter_name = 'logger_name'
+
+    def lookups(self, request, model_admin):
+        table = StatusLog._meta.db_table
+        with connections[StatusLog.objects.db].cursor() as cursor:
+            cursor.execute(f"""
+                WITH RECURSIVE names (name) AS (
+                    SELECT min(logger_name) FROM {table}
+                    UNION ALL
+                    SELECT (SELECT min(logger_name) FROM {table} WHERE logger_name > names.name)
+                    FROM names WHERE names.name IS NOT NULL
+                )
+                SELECT name FROM names WHERE name IS NOT NULL
+            """)
+            return [(name, name) for (name,) in cursor.fetchall()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(logger_name=self.value())
+        return queryset
 
 
 class StatusLogAdmin(admin.ModelAdmin):
     list_display = ('colored_msg', 'traceback', 'create_datetime_format')
-    search_fields = ('msg', 'logger_name')
+    # в PostgreSQL поиск идёт по индексу tsvector (см. get_search_results), search_fields - для остальных баз
+    search_fields = ('logger_name', 'msg', 'trace')
     list_display_links = ('colored_msg', )
-    list_filter = ('level', 'logger_name')
+    list_filter = ('level', LoggerNameFilter)
     list_per_page = 100
+    paginator = EstimatedCountPaginator
+    # без второго COUNT(*) по всей таблице для "показать все"
+    show_full_result_count = False
     # readonly_fields = ('logger_name', 'level', 'msg', 'trace', 'create_datetime')
 
+    def get_search_results(self, request, queryset, search_term):
+        if connections[queryset.db].vendor != 'postgresql' or not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        # только по индексу: слова и их начала. Часть слова из середины (Division) не ищется,
+        # LIKE по msg и trace читал бы всю таблицу
+        query = search_query(search_term, queryset.db)
+        if query is None:
+            return queryset.none(), False
+        return queryset.alias(search=search_vector()).filter(search=query), False
+
     def colored_msg(self, instance):
         if instance.level in [logging.NOTSET, logging.INFO]:
             color = 'green'
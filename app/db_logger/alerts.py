@@ -0,0 +1,190 @@
+import hashlib
+import html
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+import requests
+
+from .config import (
+    DJANGO_DB_LOGGER_ALERT_URL, DJANGO_DB_LOGGER_ALERT_CHAT_ID, DJANGO_DB_LOGGER_ALERT_WINDOW,
+    DJANGO_DB_LOGGER_ALERT_TIMEOUT, DJANGO_DB_LOGGER_ALERT_RETRIES, DJANGO_DB_LOGGER_ALERT_BACKOFF,
+    DJANGO_DB_LOGGER_ALERT_QUEUE_SIZE,
+)
+
+
+# лимит длины сообщения Telegram, считается по тексту после разбора HTML разметки
+MAX_TEXT = 4096
+# запас под заголовок оповещения и счётчик повторов
+TITLE_RESERVE = 100
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def alert_text(msg: str, trace: str = None) -> str:
+    """
+    Текст оповещения для parse_mode html. Обрезается до экранирования:
+    срез готового HTML может разрезать сущность (&amp;), и Telegram отклонит сообщение
+    """
+    text = f'{msg}\n{trace or ""}'
+    limit = MAX_TEXT - TITLE_RESERVE
+    if len(text) > limit:
+        text = text[:limit - 1] + '…'
+    return html.escape(text)
+
+
+def plain_text(text: str) -> str:
+    """
+    То же сообщение без разметки, для повторной отправки без parse_mode
+    """
+    return html.unescape(TAG_RE.sub('', text))[:MAX_TEXT]
+
+
+def fingerprint(logger_name: str, level: int, msg: str) -> str:
+    """
+    Одинаковые сообщения одного логгера и уровня считаются одним оповещением
+    """
+    return hashlib.sha1(f"{logger_name}\0{level}\0{msg}".encode()).hexdigest()
+
+
+class AlertDispatcher:
+    """
+    Отправка оповещений об ошибках в Telegram из фонового потока, submit не ждёт сеть.
+    Первое сообщение с данным fingerprint уходит сразу, повторы в течение window секунд
+    только считаются и по окончании окна отправляются одним сообщением с количеством.
+    Запрос ограничен timeout, при ошибке сети, 429 и 5xx повторяется до retries раз с backoff * 2^n секунд.
+    400 не повторяется: сообщение отправляется ещё раз без HTML разметки
+    """
+
+    def __init__(self, url=DJANGO_DB_LOGGER_ALERT_URL, chat_id=DJANGO_DB_LOGGER_ALERT_CHAT_ID,
+                 window=DJANGO_DB_LOGGER_ALERT_WINDOW, timeout=DJANGO_DB_LOGGER_ALERT_TIMEOUT,
+                 retries=DJANGO_DB_LOGGER_ALERT_RETRIES, backoff=DJANGO_DB_LOGGER_ALERT_BACKOFF,
+                 queue_size=DJANGO_DB_LOGGER_ALERT_QUEUE_SIZE):
+        self.url = url
+        self.chat_id = chat_id
+        self.window = window
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._windows = {}
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._session = requests.Session()
+
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, key: str, title: str, text: str):
+        """
+        Ставит оповещение в очередь. title - заголовок (уровень), text - сообщение и trace
+        """
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((key, title, text, time.monotonic()))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5):
+        """
+        Отправляет накопленное и останавливает поток
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+            self._pid = None
+
+    def _ensure_thread(self):
+        # после fork (воркеры gunicorn) поток родителя в процессе не существует, запускаем свой
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='db-log-alerts', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._next_deadline())
+            except queue.Empty:
+                item = False
+            if item is None:
+                self._flush_windows(force=True)
+                return
+            if item:
+                self._handle(*item)
+            self._flush_windows()
+
+    def _next_deadline(self) -> float:
+        if not self._windows:
+            return self.window
+        first = min(entry["started"] for entry in self._windows.values())
+        return max(first + self.window - time.monotonic(), 0.01)
+
+    def _handle(self, key, title, text, at):
+        entry = self._windows.get(key)
+        if entry is not None:
+            entry["count"] += 1
+            self.coalesced += 1
+            return
+        self._windows[key] = {"started": at, "count": 0, "title": title, "text": text}
+        self._send(f"{title}\n{text}")
+
+    def _flush_windows(self, force: bool = False):
+        now = time.monotonic()
+        for key, entry in list(self._windows.items()):
+            if not force and now - entry["started"] < self.window:
+                continue
+            del self._windows[key]
+            if entry["count"]:
+                self._send(f"{entry['title']} ×{entry['count']} за {self.window:g} с\n{entry['text']}")
+
+    def _send(self, text: str):
+        status, error = self._post({'text': text, 'parse_mode': 'html', 'chat_id': self.chat_id})
+        if status == 400:
+            # Telegram не разобрал разметку, повтор того же запроса не поможет
+            status, error = self._post({'text': plain_text(text), 'chat_id': self.chat_id})
+        if error is None:
+            self.sent += 1
+            return
+        self.failed += 1
+        # через logging нельзя: ошибка снова стала бы оповещением
+        sys.stderr.write(f"db_log: alert not delivered: {error}\n")
+
+    def _post(self, data: dict) -> tuple:
+        """
+        (HTTP статус или None, ошибка или None). Ошибки сети, 429 и 5xx повторяются, остальные 4xx - нет
+        """
+        status = None
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            try:
+                response = self._session.post(self.url, data=data, timeout=self.timeout)
+                status = response.status_code
+                if status < 400:
+                    return status, None
+                if status == 429:
+                    # Telegram сообщает, сколько ждать до следующего запроса
+                    retry_after = response.json().get("parameters", {}).get("retry_after")
+                    delay = max(delay, retry_after or 0)
+                elif status < 500:
+                    return status, f"HTTP {status}: {response.text[:200]}"
+                error = f"HTTP {status}"
+            except (requests.RequestException, ValueError) as e:
+                status, error = None, str(e)
+            if attempt < self.retries:
+                time.sleep(delay)
+        return status, error
+
+
+DISPATCHER = AlertDispatcher()
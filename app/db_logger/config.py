@@ -4,3 +4,28 @@ MSG_STYLE_SIMPLE = 'Simple'
 MSG_STYLE_FULL = 'Full'
 
 DJANGO_DB_LOGGER_ENABLE_FORMATTER = getattr(settings, 'DJANGO_DB_LOGGER_ENABLE_FORMATTER', False)
+
+# BatchedDatabaseLogHandler: размер очереди записей, размер пачки bulk_create и как часто (секунды) сбрасывать очередь
+DJANGO_DB_LOGGER_QUEUE_SIZE = getattr(settings, 'DJANGO_DB_LOGGER_QUEUE_SIZE', 10000)
+DJANGO_DB_LOGGER_BATCH_SIZE = getattr(settings, 'DJANGO_DB_LOGGER_BATCH_SIZE', 500)
+DJANGO_DB_LOGGER_FLUSH_INTERVAL = getattr(settings, 'DJANGO_DB_LOGGER_FLUSH_INTERVAL', 1.0)
+
+# Очередь заполнена больше чем на SAMPLE_FROM - записи ниже WARNING сохраняются с вероятностью SAMPLE_RATE
+DJANGO_DB_LOGGER_SAMPLE_FROM = getattr(settings, 'DJANGO_DB_LOGGER_SAMPLE_FROM', 0.8)
+DJANGO_DB_LOGGER_SAMPLE_RATE = getattr(settings, 'DJANGO_DB_LOGGER_SAMPLE_RATE', 0.1)
+
+# Оповещения об ошибках (db_logger.alerts): адрес Bot API, чат, окно склейки одинаковых сообщений (секунды),
+# таймаут запроса, число повторов и начальная задержка между ними, размер очереди
+DJANGO_DB_LOGGER_ALERT_URL = getattr(
+    settings, 'DJANGO_DB_LOGGER_ALERT_URL', f"https://api.telegram.org/bot{getattr(settings, 'BOT_ID', '')}/sendMessage"
+)
+DJANGO_DB_LOGGER_ALERT_CHAT_ID = getattr(settings, 'DJANGO_DB_LOGGER_ALERT_CHAT_ID', getattr(settings, 'CHAT_ID', None))
+DJANGO_DB_LOGGER_ALERT_WINDOW = getattr(settings, 'DJANGO_DB_LOGGER_ALERT_WINDOW', 60)
+DJANGO_DB_LOGGER_ALERT_TIMEOUT = getattr(settings, 'DJANGO_DB_LOGGER_ALERT_TIMEOUT', 5)
+DJANGO_DB_LOGGER_ALERT_RETRIES = getattr(settings, 'DJANGO_DB_LOGGER_ALERT_RETRIES', 3)
+DJANGO_DB_LOGGER_ALERT_BACKOFF = getattr(settings, 'DJANGO_DB_LOGGER_ALERT_BACKOFF', 1.0)
+DJANGO_DB_LOGGER_ALERT_QUEUE_SIZE = getattr(settings, 'DJANGO_DB_LOGGER_ALERT_QUEUE_SIZE', 1000)
+
+# Хранение StatusLog: сколько дней держать записи и на сколько месяцев вперёд создавать секции (PostgreSQL)
+DJANGO_DB_LOGGER_RETENTION_DAYS = getattr(settings, 'DJANGO_DB_LOGGER_RETENTION_DAYS', 90)
+DJANGO_DB_LOGGER_PARTITIONS_AHEAD = getattr(settings, 'DJANGO_DB_LOGGER_PARTITIONS_AHEAD', 2)
@@ -1,15 +1,42 @@
+import datetime
 import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
 
-from .config import DJANGO_DB_LOGGER_ENABLE_FORMATTER
+from django.conf import settings
+from django.utils import timezone
+
+from .config import (
+    DJANGO_DB_LOGGER_ENABLE_FORMATTER, DJANGO_DB_LOGGER_QUEUE_SIZE, DJANGO_DB_LOGGER_BATCH_SIZE,
+    DJANGO_DB_LOGGER_FLUSH_INTERVAL, DJANGO_DB_LOGGER_SAMPLE_FROM, DJANGO_DB_LOGGER_SAMPLE_RATE,
+)
 
 
 db_default_formatter = logging.Formatter()
 
 
+def record_datetime(record) -> datetime.datetime:
+    created = datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+    return created if settings.USE_TZ else timezone.make_naive(created)
+
+
 class DatabaseLogHandler(logging.Handler):
+    def handle(self, record):
+        # DJANGO_DB_LOGGER_ENABLED = False: запись в StatusLog выключена (тесты)
+        if not getattr(settings, 'DJANGO_DB_LOGGER_ENABLED', True):
+            return False
+        return super().handle(record)
+
     def emit(self, record):
         from .models import StatusLog
-        
+
+        StatusLog.objects.create(**self.record_fields(record))
+
+    def record_fields(self, record) -> dict:
         trace = None
 
         if record.exc_info:
@@ -20,15 +47,15 @@ class DatabaseLogHandler(logging.Handler):
         else:
             msg = record.getMessage()
 
-        kwargs = {
+        return {
             'logger_name': record.name,
             'level': record.levelno,
             'msg': msg,
-            'trace': trace
+            'trace': trace,
+            # время вызова логгера, а не записи в базу: очередь и повторы не сдвигают и не переставляют строки
+            'create_datetime': record_datetime(record),
         }
 
-        StatusLog.objects.create(**kwargs)
-
     def format(self, record):
         if self.formatter:
             fmt = self.formatter
@@ -46,3 +73,150 @@ class DatabaseLogHandler(logging.Handler):
             return fmt.formatMessage(record)
         else:
             return fmt.format(record)
+
+
+class BatchedDatabaseLogHandler(DatabaseLogHandler):
+    """
+    Неблокирующий вариант DatabaseLogHandler: emit только кладёт запись в ограниченную очередь,
+    фоновый поток пишет их в StatusLog через bulk_create пачками по batch_size или раз в flush_interval секунд.
+    Когда очередь заполнена больше чем на sample_from, записи ниже WARNING сохраняются с вероятностью sample_rate,
+    при полной очереди запись отбрасывается. Счётчики - в stats()
+    """
+
+    def __init__(self, queue_size=DJANGO_DB_LOGGER_QUEUE_SIZE, batch_size=DJANGO_DB_LOGGER_BATCH_SIZE,
+                 flush_interval=DJANGO_DB_LOGGER_FLUSH_INTERVAL, sample_from=DJANGO_DB_LOGGER_SAMPLE_FROM,
+                 sample_rate=DJANGO_DB_LOGGER_SAMPLE_RATE, level=logging.NOTSET):
+        super().__init__(level)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_from = sample_from
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._reported_dropped = 0
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.failed = 0
+
+    def emit(self, record):
+        try:
+            if record.levelno < logging.WARNING and self._filling():
+                if random.random() >= self.sample_rate:
+                    self._count('sampled_out')
+                    return
+            self._ensure_thread()
+            self._queue.put_nowait(self.record_fields(record))
+            self._count('enqueued')
+        except queue.Full:
+            self._count('dropped')
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """
+        Синхронно пишет всё, что накопилось в очереди
+        """
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                break
+            self._write(batch)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(self.flush_interval + 5)
+        try:
+            self.flush()
+        finally:
+            super().close()
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "sampled_out": self.sampled_out,
+                "failed": self.failed,
+            }
+
+    def _filling(self) -> bool:
+        return self.queue_size > 0 and self._queue.qsize() >= self.queue_size * self.sample_from
+
+    def _count(self, name: str, n: int = 1):
+        with self._counters_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _ensure_thread(self):
+        # после fork (воркеры gunicorn) поток родителя в процессе не существует, запускаем свой
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='db-log-writer', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        from django.db import close_old_connections
+
+        while not self._stop.is_set():
+            batch = self._take(self.batch_size, self.flush_interval)
+            if batch:
+                # соединение потока записи, как после запроса: разорванное или старое переоткрывается
+                close_old_connections()
+                self._write(batch)
+
+    def _take(self, limit: int, timeout: float = 0) -> list:
+        """
+        До limit записей из очереди. С timeout ждёт первую запись и добирает пачку, пока не выйдет время
+        """
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list):
+        from .models import StatusLog
+
+        with self._write_lock:
+            try:
+                objs = StatusLog.objects.bulk_create([StatusLog(**fields) for fields in batch])
+                self._count('written', len(batch))
+            except Exception as e:
+                self._count('failed', len(batch))
+                # через logging нельзя: запись вернулась бы в этот же handler
+                sys.stderr.write(f"db_log: failed to write {len(batch)} records: {e}\n")
+                objs = []
+
+        # bulk_create не вызывает StatusLog.save, оповещения об ошибках отправляются здесь
+        for obj in objs:
+            try:
+                obj.send_alert()
+            except Exception as e:
+                sys.stderr.write(f"db_log: alert failed: {e}\n")
+
+        dropped = self.dropped + self.sampled_out
+        if dropped != self._reported_dropped:
+            sys.stderr.write(f"db_log: {self.dropped} records dropped, {self.sampled_out} sampled out\n")
+            self._reported_dropped = dropped
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from db_logger.config import DJANGO_DB_LOGGER_RETENTION_DAYS
+from db_logger.tasks import statuslog_retention
+
+
+class Command(BaseCommand):
+    help = "Удаляет старые записи StatusLog (секции PostgreSQL целиком) и создаёт секции на следующие месяцы"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=DJANGO_DB_LOGGER_RETENTION_DAYS, help="Сколько дней хранить")
+
+    def handle(self, *args, **options):
+        result = statuslog_retention(options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Готово: {result}"))
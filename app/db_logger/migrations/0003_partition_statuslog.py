@@ -0,0 +1,107 @@
+# Generated by Django 5.0.6 on 2026-10-18 13:28
+
+import datetime
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# функции секционирования на момент миграции: изменения db_logger.partitions её не меняют
+TABLE = 'db_logger_statuslog'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return datetime.date(day.year, day.month, 1)
+
+
+def add_months(month: datetime.date, n: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def create_partition(cursor, month: datetime.date):
+    # секция по умолчанию при конвертации ещё пуста, переносить из неё нечего
+    name, start, end = f'{TABLE}_p{month:%Y_%m}', month.isoformat(), add_months(month, 1).isoformat()
+    cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+
+
+def convert_to_partitioned(schema_editor, ahead: int = 2):
+    """
+    Переделывает обычную таблицу StatusLog в секционированную по месяцам с переносом строк (для миграции).
+    Первичный ключ секционированной таблицы обязан включать ключ секционирования: (id, create_datetime)
+    """
+    legacy = f'{TABLE}_legacy'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT attidentity <> '' FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id'", [TABLE]
+        )
+        (identity,) = cursor.fetchone()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        (sequence,) = cursor.fetchone()
+        cursor.execute("SELECT min(create_datetime)::date FROM " + TABLE)
+        (first_day,) = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+        cursor.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {TABLE}_pkey TO {legacy}_pkey")
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY, "
+            f"PRIMARY KEY (id, create_datetime)) PARTITION BY RANGE (create_datetime)"
+        )
+        cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+        today = datetime.date.today()
+        month = month_start(first_day or today)
+        while month <= add_months(month_start(today), ahead):
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {legacy}")
+        if identity:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 0) + 1, false) FROM {TABLE}", [TABLE]
+            )
+        else:
+            # serial: последовательность принадлежит старой таблице и удалилась бы вместе с ней
+            cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id")
+        cursor.execute(f"DROP TABLE {legacy}")
+
+
+def partition_statuslog(apps, schema_editor):
+    # секционирование есть только в PostgreSQL, в остальных базах таблица остаётся обычной
+    if schema_editor.connection.vendor == 'postgresql':
+        convert_to_partitioned(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db_logger', '0002_alter_statuslog_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='statuslog',
+            name='level',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'NotSet'), (20, 'Info'), (30, 'Warning'), (10, 'Debug'), (40, 'Error'), (50, 'Fatal')], default=40),
+        ),
+        migrations.AlterField(
+            model_name='statuslog',
+            name='create_datetime',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Created at'),
+        ),
+        migrations.RunPython(partition_statuslog, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='statuslog',
+            index=models.Index(fields=['-create_datetime'], name='statuslog_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statuslog',
+            index=models.Index(fields=['level', '-create_datetime'], name='statuslog_level_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statuslog',
+            index=models.Index(fields=['logger_name', '-create_datetime'], name='statuslog_logger_created_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import CharField, Func
+
+
+class SplitWords(Func):
+    # копия db_logger.search.SplitWords на момент миграции: изменения в коде приложения её не меняют
+    function = 'regexp_replace'
+    template = "%(function)s(%(expressions)s, '\\W+', ' ', 'g')"
+    output_field = CharField()
+
+
+def search_index():
+    # индекс по тому же выражению, что db_logger.search.search_vector
+    return GinIndex(
+        SearchVector(SplitWords('logger_name'), SplitWords('msg'), SplitWords('trace'), config='simple'),
+        name='statuslog_search_idx'
+    )
+
+
+def add_search_index(apps, schema_editor):
+    # GIN по tsvector есть только в PostgreSQL, в остальных базах админка ищет через LIKE
+    if schema_editor.connection.vendor == 'postgresql':
+        model = apps.get_model('db_logger', 'StatusLog')
+        schema_editor.add_index(model, search_index())
+        # статистика по выражению индекса: без неё планировщик оценивает любой поиск в 0.5-2% строк
+        # и идёт по индексу create_datetime с фильтром
+        schema_editor.execute(f'ANALYZE {model._meta.db_table}')
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('db_logger', 'StatusLog'), search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db_logger', '0003_partition_statuslog'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
@@ -1,10 +1,11 @@
 import logging
 from django.db import models
+from django.utils import timezone
 from six import python_2_unicode_compatible
 from django.utils.translation import gettext_lazy as _
-import requests
 from project.settings_local import *
 from project.settings_local import DEV, SEND_BOT
+from .alerts import DISPATCHER, alert_text, fingerprint
 
 LOG_LEVELS = (
     (logging.NOTSET, _('NotSet')),
@@ -19,29 +20,37 @@ LOG_LEVELS = (
 @python_2_unicode_compatible
 class StatusLog(models.Model):
     logger_name = models.CharField(max_length=100)
-    level = models.PositiveSmallIntegerField(choices=LOG_LEVELS, default=logging.ERROR, db_index=True)
+    level = models.PositiveSmallIntegerField(choices=LOG_LEVELS, default=logging.ERROR)
     msg = models.TextField()
     trace = models.TextField(blank=True, null=True)
-    create_datetime = models.DateTimeField(auto_now_add=True, verbose_name='Created at')
+    # время события: DatabaseLogHandler передаёт record.created, запись в базу может идти позже
+    create_datetime = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Created at')
 
     def __str__(self):
         return self.msg
 
     def save(self, *args, **kwargs):
+        self.send_alert()
+        super(StatusLog, self).save(*args, **kwargs)
+
+    def send_alert(self):
+        """
+        Оповещение в Telegram для Error и Fatal, отправляется в фоне (см. db_logger.alerts)
+        """
         levels = {40: 'Error', 50: 'Fatal'}
         level = levels.get(self.level)
         if level and SEND_BOT:
-            text = f'{"<b>DEV</b> " if DEV else ""}<b>{level}</b>\n{self.msg}\n{self.trace}'
-
-            data = {
-                'text': text,
-                'parse_mode': 'html',
-                'chat_id': CHAT_ID,
-            }
-
-            requests.post(f'https://api.telegram.org/bot{BOT_ID}/sendMessage', data=data)
-        super(StatusLog, self).save(*args, **kwargs)
+            title = f'{"<b>DEV</b> " if DEV else ""}<b>{level}</b>'
+            DISPATCHER.submit(
+                fingerprint(self.logger_name, self.level, self.msg), title, alert_text(self.msg, self.trace)
+            )
 
     class Meta:
         ordering = ('-create_datetime',)
         verbose_name_plural = verbose_name = "Логгер"
+        # под сортировку и фильтры списка в админке
+        indexes = [
+            models.Index(fields=['-create_datetime'], name='statuslog_created_idx'),
+            models.Index(fields=['level', '-create_datetime'], name='statuslog_level_created_idx'),
+            models.Index(fields=['logger_name', '-create_datetime'], name='statuslog_logger_created_idx'),
+        ]
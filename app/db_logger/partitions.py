@@ -0,0 +1,101 @@
+import datetime
+import logging
+import re
+
+from django.db import connection as default_connection
+
+
+logger = logging.getLogger(__name__)
+
+# StatusLog в PostgreSQL - таблица, секционированная по месяцам create_datetime:
+# db_logger_statuslog_p2024_05 ... и секция по умолчанию для строк вне созданных месяцев
+TABLE = 'db_logger_statuslog'
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return datetime.date(day.year, day.month, 1)
+
+
+def add_months(month: datetime.date, n: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def is_partitioned(connection=default_connection) -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partitions(cursor) -> list:
+    """
+    Месяцы существующих секций по возрастанию
+    """
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+        [TABLE]
+    )
+    months = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_RE.match(name)
+        if match:
+            months.append(datetime.date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def create_partition(cursor, month: datetime.date):
+    """
+    Секция месяца. Строки этого месяца, попавшие в секцию по умолчанию, переносятся в неё:
+    иначе PostgreSQL не даст подключить секцию
+    """
+    name, start, end = partition_name(month), month.isoformat(), add_months(month, 1).isoformat()
+    cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE create_datetime >= %s AND create_datetime < %s "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved",
+        [start, end]
+    )
+    # индексы родительской таблицы создаются на секции при подключении
+    cursor.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    logger.info(f"StatusLog partition {name} created")
+
+
+def ensure_partitions(connection=default_connection, today: datetime.date = None, ahead: int = 2) -> list:
+    """
+    Создаёт секции с текущего месяца на ahead месяцев вперёд, возвращает созданные месяцы
+    """
+    today = today or datetime.date.today()
+    created = []
+    with connection.cursor() as cursor:
+        existing = set(partitions(cursor))
+        for n in range(ahead + 1):
+            month = add_months(month_start(today), n)
+            if month not in existing:
+                create_partition(cursor, month)
+                created.append(month)
+    return created
+
+
+def drop_partitions(connection=default_connection, before: datetime.date = None) -> list:
+    """
+    Удаляет секции, целиком лежащие раньше before, и такие строки секции по умолчанию.
+    DROP секции освобождает место сразу, без DELETE и VACUUM по всей таблице
+    """
+    dropped = []
+    with connection.cursor() as cursor:
+        for month in partitions(cursor):
+            if add_months(month, 1) <= before:
+                cursor.execute(f"DROP TABLE {partition_name(month)}")
+                dropped.append(month)
+                logger.info(f"StatusLog partition {partition_name(month)} dropped")
+        cursor.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE create_datetime < %s", [before.isoformat()])
+    return dropped
+
@@ -0,0 +1,45 @@
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db import connections
+from django.db.models import CharField, Func
+
+
+# Полнотекстовый поиск по logger_name, msg и trace StatusLog (PostgreSQL).
+# Конфигурация simple: без стемминга и стоп-слов, имена исключений, логгеров и идентификаторы ищутся как есть
+SEARCH_CONFIG = 'simple'
+
+
+class SplitWords(Func):
+    """
+    Знаки препинания заменяются пробелами. Иначе парсер оставляет connector.views (host)
+    и /app/connector/views.py (file) одной лексемой, и по views:* такие строки не находятся
+    """
+    function = 'regexp_replace'
+    template = "%(function)s(%(expressions)s, '\\W+', ' ', 'g')"
+    output_field = CharField()
+
+
+def search_vector():
+    """
+    Выражение tsvector по logger_name, msg и trace. Индекс statuslog_search_idx (миграция 0004)
+    построен по этому же выражению, иначе PostgreSQL его не использует
+    """
+    return SearchVector(SplitWords('logger_name'), SplitWords('msg'), SplitWords('trace'), config=SEARCH_CONFIG)
+
+
+def search_query(term: str, using: str = 'default'):
+    """
+    Все слова строки поиска как префиксы: "ZeroDiv connector.views" найдёт ZeroDivisionError в connector.views,
+    "views.py" - строки с путём /app/connector/views.py. Слова выделяет тот же парсер, что и для индекса.
+    Текст tsquery получается отдельным запросом: константу планировщик оценивает и выбирает индекс,
+    подзапрос в условии - нет. None, если в строке нет слов
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT string_agg(quote_literal(lexeme) || ':*', ' & ') "
+            "FROM unnest(to_tsvector(%s, regexp_replace(%s, '\\W+', ' ', 'g')))",
+            [SEARCH_CONFIG, term]
+        )
+        (query,) = cursor.fetchone()
+    if query is None:
+        return None
+    return SearchQuery(query, config=SEARCH_CONFIG, search_type='raw')
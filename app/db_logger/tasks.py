@@ -0,0 +1,35 @@
+import datetime
+import logging
+
+from celery import shared_task
+
+from . import partitions
+from .config import DJANGO_DB_LOGGER_RETENTION_DAYS, DJANGO_DB_LOGGER_PARTITIONS_AHEAD
+from .models import StatusLog
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def statuslog_retention(days=DJANGO_DB_LOGGER_RETENTION_DAYS):
+    """
+    Удаляет записи StatusLog старше days дней.
+    В секционированной таблице (PostgreSQL) удаляются целые месячные секции, лежащие до границы,
+    и заранее создаются секции на DJANGO_DB_LOGGER_PARTITIONS_AHEAD месяцев вперёд.
+    Иначе - DELETE по create_datetime
+    """
+    cutoff = datetime.date.today() - datetime.timedelta(days=days)
+    if partitions.is_partitioned():
+        created = partitions.ensure_partitions(ahead=DJANGO_DB_LOGGER_PARTITIONS_AHEAD)
+        dropped = partitions.drop_partitions(before=cutoff)
+        result = {
+            "cutoff": cutoff.isoformat(),
+            "created": [f"{month:%Y-%m}" for month in created],
+            "dropped": [f"{month:%Y-%m}" for month in dropped],
+        }
+    else:
+        deleted, _ = StatusLog.objects.filter(create_datetime__lt=cutoff).delete()
+        result = {"cutoff": cutoff.isoformat(), "deleted": deleted}
+    logger.info(f"StatusLog retention: {result}")
+    return result
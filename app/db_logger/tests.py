@@ -0,0 +1,217 @@
+import datetime
+import html
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs
+
+from django.contrib.admin import site
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from . import partitions, search
+from .alerts import MAX_TEXT, AlertDispatcher, alert_text
+from .db_log_handler import BatchedDatabaseLogHandler
+from .models import StatusLog
+from .tasks import statuslog_retention
+
+
+# своё имя логгера: строки, записанные в общую тестовую базу из потоков других тестов, в проверки не попадают
+LOGGER = 'db_logger.tests'
+
+
+def make_record(level=logging.INFO, msg='message'):
+    return logging.LogRecord(LOGGER, level, __file__, 1, msg, None, None)
+
+
+def logged():
+    return StatusLog.objects.filter(logger_name=LOGGER)
+
+
+@mock.patch.object(BatchedDatabaseLogHandler, '_ensure_thread', lambda self: None)
+class BatchedDatabaseLogHandlerTest(TestCase):
+    def test_batches(self):
+        handler = BatchedDatabaseLogHandler(queue_size=10, batch_size=2)
+        for i in range(5):
+            handler.emit(make_record(msg=f'message {i}'))
+        self.assertEqual(logged().count(), 0)
+
+        with mock.patch.object(StatusLog, 'send_alert') as send_alert:
+            handler.flush()
+        self.assertEqual(logged().count(), 5)
+        self.assertEqual(handler.stats()["written"], 5)
+        send_alert.assert_called()
+
+    def test_record_time(self):
+        handler = BatchedDatabaseLogHandler()
+        first, second = make_record(msg='first'), make_record(msg='second')
+        first.created -= 60
+        handler.emit(second)
+        handler.emit(first)
+        handler.flush()
+
+        # время строки - момент вызова логгера, а не записи пачки
+        self.assertEqual(list(logged().values_list('msg', flat=True)), ['second', 'first'])
+        created = logged().get(msg='first').create_datetime
+        self.assertAlmostEqual(created.timestamp(), first.created, delta=0.001)
+
+    def test_overflow(self):
+        handler = BatchedDatabaseLogHandler(queue_size=4, sample_from=0.5, sample_rate=0)
+        for _ in range(3):
+            handler.emit(make_record())
+        for _ in range(3):
+            handler.emit(make_record(logging.ERROR))
+
+        stats = handler.stats()
+        # после половины очереди INFO отсеиваются, ERROR занимают остаток, лишний отбрасывается
+        self.assertEqual((stats["enqueued"], stats["sampled_out"], stats["dropped"]), (4, 1, 1))
+
+    def test_enabled_setting(self):
+        handler = BatchedDatabaseLogHandler()
+        # под тестами запись выключена (project.test_runner.TestRunner)
+        handler.handle(make_record())
+        with override_settings(DJANGO_DB_LOGGER_ENABLED=True):
+            handler.handle(make_record())
+        self.assertEqual(handler.stats()["enqueued"], 1)
+
+
+class RetentionTest(TestCase):
+    def test_months(self):
+        self.assertEqual(partitions.add_months(datetime.date(2024, 11, 1), 3), datetime.date(2025, 2, 1))
+        self.assertEqual(partitions.partition_name(datetime.date(2025, 2, 1)), "db_logger_statuslog_p2025_02")
+
+    def test_retention(self):
+        old = StatusLog.objects.create(logger_name=LOGGER, level=logging.INFO, msg='old')
+        StatusLog.objects.filter(pk=old.pk).update(create_datetime=datetime.datetime.now() - datetime.timedelta(days=40))
+        StatusLog.objects.create(logger_name=LOGGER, level=logging.INFO, msg='new')
+
+        statuslog_retention(30)
+        self.assertEqual(list(logged().values_list('msg', flat=True)), ['new'])
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        StatusLog.objects.create(
+            logger_name=LOGGER, level=logging.ERROR, msg='connector.views boom',
+            trace='File "/app/connector/views.py", line 10\nZeroDivisionError: division by zero'
+        )
+        StatusLog.objects.create(logger_name=LOGGER, level=logging.INFO, msg='ok')
+
+    def admin_search(self, term):
+        queryset, _ = site._registry[StatusLog].get_search_results(None, logged(), term)
+        return list(queryset.values_list('msg', flat=True))
+
+    def test_admin_search(self):
+        self.assertEqual(self.admin_search('ZeroDivision'), ['connector.views boom'])
+        self.assertCountEqual(self.admin_search(LOGGER), ['connector.views boom', 'ok'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'tsvector есть только в PostgreSQL')
+    def test_admin_search_uses_index_only(self):
+        # часть слова из середины по индексу не находится, а LIKE по всей таблице не выполняется
+        self.assertEqual(self.admin_search('DivisionErr'), [])
+        self.assertEqual(self.admin_search(' -- '), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'tsvector есть только в PostgreSQL')
+    def test_dotted_and_path_terms(self):
+        for term in ('views', 'connector.views', 'views.py', '/app/connector/views.py', 'ZeroDiv conn', '"line 10"'):
+            found = logged().alias(search=search.search_vector()).filter(search=search.search_query(term))
+            self.assertEqual(list(found.values_list('msg', flat=True)), ['connector.views boom'], term)
+        self.assertIsNone(search.search_query(' -- '))
+        self.assertEqual(search.search_query('ZeroDiv views.py').source_expressions[-1].value, "'py':* & 'views':* & 'zerodiv':*")
+
+    @skipUnless(connection.vendor == 'postgresql', 'tsvector есть только в PostgreSQL')
+    def test_uses_index(self):
+        found = StatusLog.objects.alias(search=search.search_vector()).filter(search=search.search_query('views'))
+        sql, params = found.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('Bitmap Index Scan', plan)
+
+
+class StubBotAPI(BaseHTTPRequestHandler):
+    """
+    Bot API: запоминает текст сообщений, первые fail_first запросов отвечает 500,
+    при reject_html сообщения с parse_mode отклоняет с 400
+    """
+    messages = []
+    fail_first = 0
+    reject_html = False
+    requests = 0
+
+    def do_POST(self):
+        body = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        StubBotAPI.requests += 1
+        if StubBotAPI.reject_html and "parse_mode" in body:
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write(b'{"ok": false, "description": "Bad Request: can\'t parse entities"}')
+            return
+        if StubBotAPI.fail_first:
+            StubBotAPI.fail_first -= 1
+            self.send_response(500)
+            self.end_headers()
+            return
+        StubBotAPI.messages.append(body["text"][0])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps({"ok": True}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class AlertDispatcherTest(TestCase):
+    def setUp(self):
+        StubBotAPI.messages = []
+        StubBotAPI.fail_first = 0
+        StubBotAPI.reject_html = False
+        StubBotAPI.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubBotAPI)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/sendMessage"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_coalesce(self):
+        dispatcher = AlertDispatcher(self.url, "chat", window=0.3, timeout=1, retries=0)
+        for _ in range(3):
+            dispatcher.submit("a", "<b>Error</b>", "boom")
+        dispatcher.submit("b", "<b>Error</b>", "other")
+        time.sleep(0.6)
+        dispatcher.close()
+
+        self.assertEqual(StubBotAPI.messages, [
+            "<b>Error</b>\nboom", "<b>Error</b>\nother", "<b>Error</b> ×2 за 0.3 с\nboom"
+        ])
+        self.assertEqual((dispatcher.sent, dispatcher.coalesced), (3, 2))
+
+    def test_retry(self):
+        StubBotAPI.fail_first = 2
+        dispatcher = AlertDispatcher(self.url, "chat", window=0.1, timeout=1, retries=2, backoff=0.01)
+        dispatcher.submit("a", "<b>Fatal</b>", "boom")
+        dispatcher.close()
+
+        self.assertEqual(StubBotAPI.messages, ["<b>Fatal</b>\nboom"])
+        self.assertEqual((dispatcher.sent, dispatcher.failed), (1, 0))
+
+    def test_rejected_html_sent_as_plain_text(self):
+        StubBotAPI.reject_html = True
+        dispatcher = AlertDispatcher(self.url, "chat", window=0.1, timeout=1, retries=2, backoff=0.01)
+        dispatcher.submit("a", "<b>Error</b>", alert_text("a < b & c"))
+        dispatcher.close()
+
+        self.assertEqual(StubBotAPI.messages, ["Error\na < b & c\n"])
+        self.assertEqual((StubBotAPI.requests, dispatcher.sent, dispatcher.failed), (2, 1, 0))
+
+    def test_text_cut_before_escaping(self):
+        text = alert_text("&" * MAX_TEXT, "trace")
+        self.assertTrue(text.endswith("&amp;…"))
+        self.assertLess(len(html.unescape(text)), MAX_TEXT)
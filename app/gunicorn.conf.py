@@ -0,0 +1,20 @@
+import os
+import shutil
+
+# Метрики prometheus (connector.metrics) общие для всех воркеров:
+# каждый процесс пишет значения в свои файлы в этой папке, /metrics суммирует их.
+# Переменная должна быть задана до импорта prometheus_client в воркерах
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+
+def on_starting(server):
+    # файлы прошлого запуска дали бы устаревшие значения
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -127,6 +127,22 @@ CELERY_BROKER_URL = "redis://redis:6379"
 CELERY_RESULT_BACKEND = "redis://redis:6379"
 CELERY_TASK_TIME_LIMIT = 3600
 
+# Проверка новой версии снапшота по manifest.json, уже проверенная версия пропускается
+CELERY_BEAT_SCHEDULE = {
+    'connector-verify-snapshot': {
+        'task': 'connector.tasks.verify_snapshot',
+        'schedule': timedelta(minutes=1),
+    },
+    'db-logger-retention': {
+        'task': 'db_logger.tasks.statuslog_retention',
+        'schedule': timedelta(hours=6),
+    },
+    'connector-query-profile-retention': {
+        'task': 'connector.tasks.query_profile_retention',
+        'schedule': timedelta(hours=6),
+    },
+}
+
 ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
@@ -242,7 +258,8 @@ LOGGING = {
         'db_log': {
             'level': 'DEBUG',
             'formatter': 'db_log',
-            'class': 'db_logger.db_log_handler.DatabaseLogHandler'
+            # запись в StatusLog пачками из фонового потока, DatabaseLogHandler - синхронно по записи
+            'class': 'db_logger.db_log_handler.BatchedDatabaseLogHandler'
         },
         'file_api': {
             'class': 'logging.FileHandler',
@@ -266,4 +283,9 @@ LOGGING = {
     },
 }
 
+# False - handler db_log не пишет записи в StatusLog (под тестами выключает project.test_runner.TestRunner)
+DJANGO_DB_LOGGER_ENABLED = os.environ.get('DJANGO_DB_LOGGER_ENABLED', '1') != '0'
+
+TEST_RUNNER = 'project.test_runner.TestRunner'
+
 DJANGO_DB_LOGGER_ENABLE_FORMATTER = True
\ No newline at end of file
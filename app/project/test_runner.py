@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Под тестами handler db_log не пишет в StatusLog: фоновый поток BatchedDatabaseLogHandler и потоки пулов
+    коммитили бы записи в тестовую базу мимо транзакции TestCase или ждали бы её блокировок.
+    Тесты db_logger вызывают emit своих экземпляров handler напрямую
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._db_logger_enabled = settings.DJANGO_DB_LOGGER_ENABLED
+        settings.DJANGO_DB_LOGGER_ENABLED = False
+
+    def teardown_test_environment(self, **kwargs):
+        settings.DJANGO_DB_LOGGER_ENABLED = self._db_logger_enabled
+        super().teardown_test_environment(**kwargs)
@@ -37,7 +37,7 @@ def custom_500_handler(request, exc):
     return JsonResponse(error_details, status=500)
 
 from main.views import router as main_router
-from connector.views import router as conn_router
+from connector.views import router as conn_router, metrics_view
 
 api.add_router('main/', main_router, tags=["Главная"])
 api.add_router('conn/', conn_router, tags=["Коннектор"])
@@ -46,6 +46,7 @@ api.add_router('conn/', conn_router, tags=["Коннектор"])
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api.urls, name='api'),
+    path('metrics', metrics_view, name='metrics'),
 
     path('', include('main.urls'), name='index'),
     path('', include('user.urls'), name='accounts'),